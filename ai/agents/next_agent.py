@@ -1,6 +1,8 @@
 from typing import List, Dict, Any
 import json
 from ai.llm.inference import run_inference
+from ai.tracing.tracer import traced, start_span, set_attribute
+from ai.tracing.profiler import sampled_profile
 
 # Define the input schema
 INPUT_SCHEMA = {
@@ -72,6 +74,8 @@ The output should be readable by json.loads().
 
 model_name = "gpt-4o"
 
+@traced("agent.next_agent")
+@sampled_profile("agent.next_agent")
 def get_next_agent(messages, model_name=model_name) -> str:
     """
     Determine the next agent to handle the request based on current state.
@@ -82,8 +86,10 @@ def get_next_agent(messages, model_name=model_name) -> str:
     
     # attempt 3 times
     for attempt in range(3):
+        set_attribute("agent.attempts", attempt + 1)
         try:
-            response = run_inference(messages, model_name=model_name)
+            with start_span("agent.inference", {"agent.retry": attempt}):
+                response = run_inference(messages, model_name=model_name)
             
             # Create a default response
             result = {
@@ -96,36 +102,38 @@ def get_next_agent(messages, model_name=model_name) -> str:
                 "do_we_have_enough_information_to_run_workflow": False
             }
             
-            # Try to extract information from the response
-            try:
-                # First try to parse as JSON
-                parsed = json.loads(response)
-                if isinstance(parsed, dict):
-                    # Update result with parsed values
-                    for key in result:
-                        if key in parsed:
-                            result[key] = parsed[key]
-            except json.JSONDecodeError:
-                # If not JSON, try to extract information from text
-                lines = response.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
+            with start_span("agent.parse") as parse_span:
+                # Try to extract information from the response
+                try:
+                    # First try to parse as JSON
+                    parsed = json.loads(response)
+                    if isinstance(parsed, dict):
+                        # Update result with parsed values
+                        for key in result:
+                            if key in parsed:
+                                result[key] = parsed[key]
+                except json.JSONDecodeError:
+                    parse_span.set_attribute("agent.json_fallback", True)
+                    # If not JSON, try to extract information from text
+                    lines = response.split('\n')
+                    for line in lines:
+                        line = line.strip()
+                        if not line:
+                            continue
                     
-                    # Try to match key-value pairs
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        key = key.strip().lower().replace(' ', '_')
-                        value = value.strip()
+                        # Try to match key-value pairs
+                        if ':' in line:
+                            key, value = line.split(':', 1)
+                            key = key.strip().lower().replace(' ', '_')
+                            value = value.strip()
                         
-                        if key in result:
-                            if isinstance(result[key], bool):
-                                # Handle booleans
-                                result[key] = value.lower() in ['true', 'yes', '1']
-                            else:
-                                # Handle strings
-                                result[key] = value
+                            if key in result:
+                                if isinstance(result[key], bool):
+                                    # Handle booleans
+                                    result[key] = value.lower() in ['true', 'yes', '1']
+                                else:
+                                    # Handle strings
+                                    result[key] = value
             
             # Validate next_agent
             valid_agents = ["user_understanding", "user_interface", "workflow_designer", "workflow_developer", "workflow_runner"]
@@ -1,6 +1,8 @@
 from typing import List, Dict, Any
 import json
 from ai.llm.inference import run_inference
+from ai.tracing.tracer import traced, start_span, set_attribute
+from ai.tracing.profiler import sampled_profile
 
 SYSTEM = """
 You are the VibeFlows UI Agent.
@@ -35,6 +37,8 @@ OUTPUT_SCHEMA: str = ""
 
 model_name = "gpt-4o"
 
+@traced("agent.user_interface")
+@sampled_profile("agent.user_interface")
 def get_user_ineterface_reponse(messages: List[Dict[str, Any]], model_name=model_name) -> Dict[str, Any]:
     """
     Get user understanding from the input messages.
@@ -45,9 +49,11 @@ def get_user_ineterface_reponse(messages: List[Dict[str, Any]], model_name=model
     full_messages = [{"role": "system", "content": SYSTEM}] + messages
     
     # attempt 3 times
-    for _ in range(3):
+    for attempt in range(3):
+        set_attribute("agent.attempts", attempt + 1)
         try:
-            return run_inference(full_messages, model_name=model_name)
+            with start_span("agent.inference", {"agent.retry": attempt}):
+                return run_inference(full_messages, model_name=model_name)
         except Exception as e:
             print(f"Error: {e}")
             error_message = f"When we ran LLM, this error occurred. Please fix your response and comply with the output schema. Error: {e}"
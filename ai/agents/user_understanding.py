@@ -1,6 +1,8 @@
 from typing import List, Dict, Any
 import json
 from ai.llm.inference import run_inference
+from ai.tracing.tracer import traced, start_span, set_attribute
+from ai.tracing.profiler import sampled_profile
 
 # Define the input schema
 INPUT_SCHEMA: List[Dict[str, Any]] = []
@@ -82,6 +84,8 @@ The output should be readable by json.loads().
 
 model_name = "gpt-4o"
 
+@traced("agent.user_understanding")
+@sampled_profile("agent.user_understanding")
 def get_user_understanding(messages: List[Dict[str, Any]], model_name=model_name) -> str:
     """
     Get user understanding from the input messages.
@@ -92,8 +96,10 @@ def get_user_understanding(messages: List[Dict[str, Any]], model_name=model_name
     
     # attempt 3 times
     for attempt in range(3):
+        set_attribute("agent.attempts", attempt + 1)
         try:
-            response = run_inference(full_messages, model_name=model_name)
+            with start_span("agent.inference", {"agent.retry": attempt}):
+                response = run_inference(full_messages, model_name=model_name)
             
             # Create a dictionary with the required structure
             result = {
@@ -112,42 +118,44 @@ def get_user_understanding(messages: List[Dict[str, Any]], model_name=model_name
                 "do_we_have_enough_information_to_run_workflow": False
             }
             
-            # Try to extract information from the response
-            try:
-                # First try to parse as JSON
-                parsed = json.loads(response)
-                result.update(parsed)
-            except json.JSONDecodeError:
-                # If not JSON, try to extract information from text
-                lines = response.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
+            with start_span("agent.parse") as parse_span:
+                # Try to extract information from the response
+                try:
+                    # First try to parse as JSON
+                    parsed = json.loads(response)
+                    result.update(parsed)
+                except json.JSONDecodeError:
+                    parse_span.set_attribute("agent.json_fallback", True)
+                    # If not JSON, try to extract information from text
+                    lines = response.split('\n')
+                    for line in lines:
+                        line = line.strip()
+                        if not line:
+                            continue
                     
-                    # Try to match key-value pairs
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        key = key.strip().lower().replace(' ', '_')
-                        value = value.strip()
+                        # Try to match key-value pairs
+                        if ':' in line:
+                            key, value = line.split(':', 1)
+                            key = key.strip().lower().replace(' ', '_')
+                            value = value.strip()
                         
-                        # Map the key to our schema
-                        if key in result:
-                            if isinstance(result[key], list):
-                                # Handle lists
-                                if value.startswith('[') and value.endswith(']'):
-                                    try:
-                                        result[key] = json.loads(value)
-                                    except:
-                                        result[key] = [v.strip() for v in value[1:-1].split(',')]
+                            # Map the key to our schema
+                            if key in result:
+                                if isinstance(result[key], list):
+                                    # Handle lists
+                                    if value.startswith('[') and value.endswith(']'):
+                                        try:
+                                            result[key] = json.loads(value)
+                                        except:
+                                            result[key] = [v.strip() for v in value[1:-1].split(',')]
+                                    else:
+                                        result[key] = [value]
+                                elif isinstance(result[key], bool):
+                                    # Handle booleans
+                                    result[key] = value.lower() in ['true', 'yes', '1']
                                 else:
-                                    result[key] = [value]
-                            elif isinstance(result[key], bool):
-                                # Handle booleans
-                                result[key] = value.lower() in ['true', 'yes', '1']
-                            else:
-                                # Handle strings
-                                result[key] = value
+                                    # Handle strings
+                                    result[key] = value
             
             # Convert to JSON string
             return json.dumps(result, ensure_ascii=False)
@@ -1,6 +1,8 @@
 from typing import List, Dict, Any
 import json
 from ai.llm.inference import run_inference
+from ai.tracing.tracer import traced, start_span, set_attribute
+from ai.tracing.profiler import sampled_profile
 
 # Define the input schema
 INPUT_SCHEMA: List[Dict[str, Any]] = []
@@ -60,6 +62,8 @@ The output should be readable by json.loads().
 
 model_name = "gpt-4o"
 
+@traced("agent.workflow_designer")
+@sampled_profile("agent.workflow_designer")
 def design_workflow(messages: List[Dict[str, Any]], model_name=model_name) -> str:
     """
     Design a workflow based on user requirements.
@@ -70,69 +74,73 @@ def design_workflow(messages: List[Dict[str, Any]], model_name=model_name) -> st
     
     # attempt 3 times
     for attempt in range(3):
+        set_attribute("agent.attempts", attempt + 1)
         try:
-            response = run_inference(full_messages, model_name=model_name)
+            with start_span("agent.inference", {"agent.retry": attempt}):
+                response = run_inference(full_messages, model_name=model_name)
             
             # Create a default empty workflow
             result = []
             
-            # Try to extract information from the response
-            try:
-                # First try to parse as JSON
-                parsed = json.loads(response)
-                if isinstance(parsed, list):
-                    # Validate each step in the workflow
-                    for step in parsed:
-                        if all(key in step for key in ["label", "description", "integrations"]):
-                            result.append({
-                                "label": str(step["label"]),
-                                "description": str(step["description"]),
-                                "integrations": [str(i) for i in step["integrations"]]
-                            })
-            except json.JSONDecodeError:
-                # If not JSON, try to extract information from text
-                lines = response.split('\n')
-                current_step = None
+            with start_span("agent.parse") as parse_span:
+                # Try to extract information from the response
+                try:
+                    # First try to parse as JSON
+                    parsed = json.loads(response)
+                    if isinstance(parsed, list):
+                        # Validate each step in the workflow
+                        for step in parsed:
+                            if all(key in step for key in ["label", "description", "integrations"]):
+                                result.append({
+                                    "label": str(step["label"]),
+                                    "description": str(step["description"]),
+                                    "integrations": [str(i) for i in step["integrations"]]
+                                })
+                except json.JSONDecodeError:
+                    parse_span.set_attribute("agent.json_fallback", True)
+                    # If not JSON, try to extract information from text
+                    lines = response.split('\n')
+                    current_step = None
                 
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
+                    for line in lines:
+                        line = line.strip()
+                        if not line:
+                            continue
                     
-                    # Look for step indicators
-                    if line.lower().startswith(("step", "task", "action")):
-                        if current_step:
-                            result.append(current_step)
-                        current_step = {
-                            "label": "",
-                            "description": "",
-                            "integrations": []
-                        }
-                        # Extract label from the step line
-                        label = line.split(":", 1)[1].strip() if ":" in line else line
-                        current_step["label"] = label
-                    elif current_step:
-                        # Try to match key-value pairs
-                        if ':' in line:
-                            key, value = line.split(':', 1)
-                            key = key.strip().lower()
-                            value = value.strip()
+                        # Look for step indicators
+                        if line.lower().startswith(("step", "task", "action")):
+                            if current_step:
+                                result.append(current_step)
+                            current_step = {
+                                "label": "",
+                                "description": "",
+                                "integrations": []
+                            }
+                            # Extract label from the step line
+                            label = line.split(":", 1)[1].strip() if ":" in line else line
+                            current_step["label"] = label
+                        elif current_step:
+                            # Try to match key-value pairs
+                            if ':' in line:
+                                key, value = line.split(':', 1)
+                                key = key.strip().lower()
+                                value = value.strip()
                             
-                            if key in ["description", "desc"]:
-                                current_step["description"] = value
-                            elif key in ["integration", "integrations"]:
-                                # Handle integrations list
-                                if value.startswith('[') and value.endswith(']'):
-                                    try:
-                                        current_step["integrations"] = json.loads(value)
-                                    except:
-                                        current_step["integrations"] = [v.strip() for v in value[1:-1].split(',')]
-                                else:
-                                    current_step["integrations"] = [value]
+                                if key in ["description", "desc"]:
+                                    current_step["description"] = value
+                                elif key in ["integration", "integrations"]:
+                                    # Handle integrations list
+                                    if value.startswith('[') and value.endswith(']'):
+                                        try:
+                                            current_step["integrations"] = json.loads(value)
+                                        except:
+                                            current_step["integrations"] = [v.strip() for v in value[1:-1].split(',')]
+                                    else:
+                                        current_step["integrations"] = [value]
                 
-                # Add the last step if exists
-                if current_step:
-                    result.append(current_step)
+                    # Add the last step if exists
+                    if current_step:
+                        result.append(current_step)
             
             # Convert to JSON string
             return json.dumps(result, ensure_ascii=False)
@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Hashable, Tuple
+
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+_MISSING = object()
+
+def approx_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """Approximate the memory footprint of a document in bytes (recursive sys.getsizeof)."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, _seen) + approx_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, _seen) for v in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(approx_size(getattr(obj, s, None), _seen) for s in obj.__slots__)
+    return size
+
+class MessageRecord:
+    """
+    Compact in-memory form of a `messages` document.
+    Uses __slots__ so each record carries no per-instance __dict__; fields we
+    don't know about are kept in `extra` only when present.
+    """
+    __slots__ = ("_id", "chatId", "role", "content", "createdAt", "extra")
+
+    def __init__(self, _id: Any, chatId: Optional[str], role: Optional[str],
+                 content: Any, createdAt: Any = None, extra: Optional[Dict[str, Any]] = None):
+        self._id = _id
+        self.chatId = chatId
+        self.role = role
+        self.content = content
+        self.createdAt = createdAt
+        self.extra = extra
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "MessageRecord":
+        extra = {k: v for k, v in doc.items() if k not in cls.__slots__}
+        return cls(doc.get("_id"), doc.get("chatId"), doc.get("role"), doc.get("content"),
+                   doc.get("createdAt"), extra or None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        doc = {"_id": self._id, "chatId": self.chatId, "role": self.role, "content": self.content}
+        if self.createdAt is not None:
+            doc["createdAt"] = self.createdAt
+        if self.extra:
+            doc.update(self.extra)
+        return doc
+
+    def __repr__(self) -> str:
+        return f"MessageRecord(_id={self._id!r}, chatId={self.chatId!r}, role={self.role!r})"
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry TTL and a cap on both the number of
+    entries and their approximate total size in bytes.
+    Keeps hit/miss/eviction counters for hit-ratio metrics.
+    """
+
+    def __init__(self, name: str, ttl: float = CACHE_TTL_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = approx_size(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if size > self.max_bytes:
+                # Would evict everything else and still not fit; don't cache it.
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Read-through: return the cached value, or call loader() and cache its result."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hit_ratio,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,257 @@
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Callable, Deque, Iterable
+from pymongo.errors import OperationFailure, PyMongoError
+from ai.db.cache import MessageRecord
+from ai.db.mongodb import (get_db, get_messages_after, get_last_messages, get_last_message_id,
+                           invalidate_users, invalidate_chats)
+
+# A handler receives the chat id and the newly inserted messages of that chat, oldest first.
+MessageHandler = Callable[[str, List[Dict[str, Any]]], None]
+
+TAIL_SIZE = 50
+POLL_INTERVAL = 1.0
+
+class MessageStream:
+    """
+    Pushes new `messages` inserts to a handler as they arrive, instead of
+    re-reading a chat's whole history with get_all_messages().
+
+    Uses a MongoDB change stream when the server supports it (replica sets and
+    sharded clusters). On a standalone or test server the $changeStream stage is
+    rejected, and we fall back to polling for documents whose _id is greater than
+    the last one we have seen.
+
+    A bounded per-chat tail buffer of the most recent messages is kept in memory
+    as compact MessageRecords, so agents can read recent context without going
+    back to the database.
+    """
+
+    def __init__(self, handler: Optional[MessageHandler] = None,
+                 chat_ids: Optional[Iterable[str]] = None,
+                 tail_size: int = TAIL_SIZE,
+                 poll_interval: float = POLL_INTERVAL,
+                 use_change_stream: bool = True):
+        self.handler = handler
+        self.chat_ids = set(chat_ids) if chat_ids else None
+        self.tail_size = tail_size
+        self.poll_interval = poll_interval
+        self.use_change_stream = use_change_stream
+        self.mode: Optional[str] = None  # "change_stream" or "polling" once started
+        self._tails: Dict[str, Deque[MessageRecord]] = {}
+        # chat_id -> messages dispatched while get_tail() is reading that chat's seed
+        self._seeding: Dict[str, List[MessageRecord]] = {}
+        self._last_id: Any = None
+        self._resume_token: Any = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Tail buffer ---
+
+    def get_tail(self, chat_id: str) -> List[Dict[str, Any]]:
+        """
+        Get the buffered recent messages of a chat, oldest first.
+        The first call for a chat seeds the buffer with its last tail_size messages.
+        """
+        with self._lock:
+            tail = self._tails.get(chat_id)
+            if tail is not None:
+                return [r.to_dict() for r in tail]
+            owner = chat_id not in self._seeding
+            if owner:
+                # Messages dispatched while we read the seed are buffered by _append().
+                self._seeding[chat_id] = []
+        try:
+            seed = [MessageRecord.from_doc(d) for d in get_last_messages(chat_id, self.tail_size)]
+        except Exception:
+            if owner:
+                with self._lock:
+                    self._seeding.pop(chat_id, None)
+            raise
+        with self._lock:
+            tail = self._tails.get(chat_id)
+            if tail is None:
+                seen = {r._id for r in seed}
+                pending = self._seeding.pop(chat_id, []) if owner else list(self._seeding.get(chat_id, []))
+                merged = seed + [r for r in pending if r._id not in seen]
+                if not owner:
+                    # Another caller is seeding this chat and will store the tail.
+                    return [r.to_dict() for r in merged[-self.tail_size:]]
+                tail = deque(merged, maxlen=self.tail_size)
+                self._tails[chat_id] = tail
+            return [r.to_dict() for r in tail]
+
+    def _append(self, chat_id: str, messages: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            tail = self._tails.get(chat_id)
+            if tail is None:
+                pending = self._seeding.get(chat_id)
+                if pending is not None:
+                    pending.extend(MessageRecord.from_doc(m) for m in messages)
+                # Otherwise not seeded yet; get_tail() will read the latest messages from the database.
+                return
+            seen = {r._id for r in tail}
+            tail.extend(MessageRecord.from_doc(m) for m in messages if m.get("_id") not in seen)
+
+    def _dispatch(self, docs: List[Dict[str, Any]]) -> None:
+        """Group new documents by chat, update the tail buffers and notify the handler."""
+        by_chat: Dict[str, List[Dict[str, Any]]] = {}
+        for doc in docs:
+            self._last_id = doc["_id"]
+            chat_id = doc.get("chatId")
+            if self.chat_ids is not None and chat_id not in self.chat_ids:
+                continue
+            by_chat.setdefault(chat_id, []).append(doc)
+
+        for chat_id, messages in by_chat.items():
+            self._append(chat_id, messages)
+            if self.handler:
+                try:
+                    self.handler(chat_id, messages)
+                except Exception as e:
+                    print(f"Message handler error for chat {chat_id}: {e}")
+
+    # --- Ingestion loops ---
+
+    def _watch(self) -> None:
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        if self.chat_ids is not None:
+            pipeline[0]["$match"]["fullDocument.chatId"] = {"$in": list(self.chat_ids)}
+
+        db = get_db()
+        with db.messages.watch(pipeline, resume_after=self._resume_token) as stream:
+            self.mode = "change_stream"
+            # Catch up on messages inserted between start() (or a disconnect) and the
+            # cursor opening; the stream may deliver some of them again, so skip those.
+            caught_up = self._fetch_new()
+            self._dispatch(caught_up)
+            caught_up_ids = {doc["_id"] for doc in caught_up}
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is None:
+                    # try_next() waits up to maxAwaitTimeMS; loop again to check for stop.
+                    continue
+                self._resume_token = stream.resume_token
+                doc = change["fullDocument"]
+                if doc["_id"] in caught_up_ids:
+                    caught_up_ids.discard(doc["_id"])
+                    continue
+                self._dispatch([doc])
+
+    def _fetch_new(self) -> List[Dict[str, Any]]:
+        chat_ids = list(self.chat_ids) if self.chat_ids is not None else None
+        return get_messages_after(self._last_id, chat_ids=chat_ids)
+
+    def _poll(self) -> None:
+        self.mode = "polling"
+        while not self._stop.is_set():
+            try:
+                docs = self._fetch_new()
+                if docs:
+                    self._dispatch(docs)
+                    continue
+            except PyMongoError as e:
+                print(f"Error polling messages: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _run(self) -> None:
+        if self.use_change_stream:
+            while not self._stop.is_set():
+                try:
+                    self._watch()
+                    return
+                except OperationFailure as e:
+                    # Standalone servers reject $changeStream; fall back to polling.
+                    print(f"Change streams unavailable ({e}), falling back to polling.")
+                    break
+                except PyMongoError as e:
+                    print(f"Change stream interrupted: {e}. Resuming.")
+                    self._stop.wait(self.poll_interval)
+        self._poll()
+
+    # --- Lifecycle ---
+
+    def start(self) -> "MessageStream":
+        """Start ingesting in a background thread. Only messages inserted from now on are pushed."""
+        if self._thread and self._thread.is_alive():
+            return self
+        if self._last_id is None:
+            self._last_id = get_last_message_id()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="message-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop ingesting and wait for the background thread to exit."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self) -> "MessageStream":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+class CacheInvalidator:
+    """
+    Watches the users and chats collections and drops the matching entries of the
+    data layer caches on every change, so writes made by other processes are seen
+    before the cache TTL runs out. Without change stream support (standalone
+    servers) it exits and the caches rely on their TTL alone.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _handle(self, change: Dict[str, Any]) -> None:
+        collection = change.get("ns", {}).get("coll")
+        if collection == "users":
+            invalidate_users()
+        elif collection == "chats":
+            doc = change.get("fullDocument") or {}
+            # Deletes and partial updates don't carry user_id; drop all cached chats then.
+            invalidate_chats(doc.get("user_id"))
+
+    def _run(self) -> None:
+        pipeline = [{"$match": {"ns.coll": {"$in": ["users", "chats"]}}}]
+        try:
+            with get_db().watch(pipeline, full_document="updateLookup") as stream:
+                while not self._stop.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        self._handle(change)
+        except OperationFailure as e:
+            print(f"Change streams unavailable ({e}), cache invalidation relies on TTL.")
+        except PyMongoError as e:
+            print(f"Cache invalidation stream stopped: {e}")
+
+    def start(self) -> "CacheInvalidator":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+def watch_messages(handler: MessageHandler, chat_ids: Optional[Iterable[str]] = None, **kwargs) -> MessageStream:
+    """Start a MessageStream that pushes new messages to handler. Call .stop() when done."""
+    return MessageStream(handler, chat_ids=chat_ids, **kwargs).start()
+
+# --- Example Usage ---
+def test_message_stream():
+    def on_messages(chat_id: str, messages: List[Dict[str, Any]]) -> None:
+        print(f"{len(messages)} new message(s) in chat {chat_id}")
+
+    with MessageStream(on_messages) as stream:
+        time.sleep(10)
+        print(f"Ingestion mode: {stream.mode}")
@@ -1,32 +1,117 @@
 import os
+import threading
 from typing import List, Dict, Any, Optional
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from ai.db.cache import TTLCache
+from ai.tracing.tracer import traced, set_attribute
 
 MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_DATABASE = os.getenv("MONGODB_DATABASE")
 
+# Read-through caches for the hot users/chats reads. See invalidate_users() / invalidate_chats().
+# Off unless MONGODB_CACHE=1 or use_cache=True: writes made outside ai/db/writer.py are only
+# seen once the TTL runs out, unless ai.db.message_stream.CacheInvalidator is running.
+# A cache hit returns a new list of shallow copies of the cached documents: callers can
+# add, change or drop top-level fields freely, but nested values are shared with the
+# cache and must not be modified in place. (A deepcopy per hit would cost about as
+# much as the query it saves.)
+CACHE_ENABLED = os.getenv("MONGODB_CACHE") == "1"
+users_cache = TTLCache("users")
+chats_cache = TTLCache("chats")
+
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
 def get_client() -> MongoClient:
-    """Get MongoDB client."""
-    return MongoClient(MONGODB_URI)
+    """Get the shared MongoDB client (one connection pool per process; MongoClient is thread-safe)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGODB_URI)
+    return _client
 
 def get_db():
     """Get database instance."""
     client = get_client()
     return client[MONGODB_DATABASE]
 
-def get_all_users() -> List[Dict[str, Any]]:
-    """Get all users."""
-    db = get_db()
-    return list(db.users.find())
+def _copy_docs(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [dict(doc) for doc in docs]
 
-def get_all_chats(user_id: Optional[str] = None) -> List[Dict[str, Any]]:
-    """Get all chats, optionally filtered by user_id."""
-    db = get_db()
-    query = {"user_id": user_id} if user_id else {}
-    return list(db.chats.find(query))
+@traced("db.get_all_users", {"db.collection": "users"})
+def get_all_users(use_cache: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """Get all users. use_cache defaults to CACHE_ENABLED."""
+    def load():
+        set_attribute("db.cache_hit", False)
+        db = get_db()
+        return list(db.users.find())
+    if not (CACHE_ENABLED if use_cache is None else use_cache):
+        return load()
+    set_attribute("db.cache_hit", True)
+    return _copy_docs(users_cache.get_or_load("all", load))
 
+@traced("db.get_all_chats", {"db.collection": "chats"})
+def get_all_chats(user_id: Optional[str] = None, use_cache: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """Get all chats, optionally filtered by user_id. use_cache defaults to CACHE_ENABLED."""
+    def load():
+        set_attribute("db.cache_hit", False)
+        db = get_db()
+        query = {"user_id": user_id} if user_id else {}
+        return list(db.chats.find(query))
+    if not (CACHE_ENABLED if use_cache is None else use_cache):
+        return load()
+    set_attribute("db.cache_hit", True)
+    return _copy_docs(chats_cache.get_or_load(user_id or None, load))
+
+@traced("db.get_all_messages", {"db.collection": "messages"})
 def get_all_messages(chat_id: Optional[str] = None) -> List[Dict[str, Any]]:
     """Get all messages, optionally filtered by chatId."""
     db = get_db()
     query = {"chatId": chat_id} if chat_id else {}
-    return list(db.messages.find(query)) 
\ No newline at end of file
+    return list(db.messages.find(query))
+
+@traced("db.get_messages_after", {"db.collection": "messages"})
+def get_messages_after(after_id: Any = None, chat_id: Optional[str] = None, limit: int = 0,
+                       chat_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Get messages inserted after after_id (by _id order), optionally filtered by chatId or a list of chat_ids."""
+    db = get_db()
+    query: Dict[str, Any] = {}
+    if chat_id:
+        query["chatId"] = chat_id
+    elif chat_ids is not None:
+        query["chatId"] = {"$in": list(chat_ids)}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    return list(db.messages.find(query).sort("_id", ASCENDING).limit(limit))
+
+@traced("db.get_last_messages", {"db.collection": "messages"})
+def get_last_messages(chat_id: str, n: int) -> List[Dict[str, Any]]:
+    """Get the last n messages of a chat, oldest first."""
+    db = get_db()
+    docs = list(db.messages.find({"chatId": chat_id}).sort("_id", DESCENDING).limit(n))
+    docs.reverse()
+    return docs
+
+@traced("db.get_last_message_id", {"db.collection": "messages"})
+def get_last_message_id() -> Any:
+    """Get the _id of the most recently inserted message, or None if there are none."""
+    db = get_db()
+    doc = db.messages.find_one({}, projection={"_id": 1}, sort=[("_id", DESCENDING)])
+    return doc["_id"] if doc else None
+
+def invalidate_users() -> None:
+    """Drop cached users. Call after writing to the users collection."""
+    users_cache.clear()
+
+def invalidate_chats(user_id: Optional[str] = None) -> None:
+    """Drop cached chats of user_id (and the unfiltered listing). Without user_id, drop all cached chats."""
+    if user_id:
+        chats_cache.invalidate(user_id)
+        chats_cache.invalidate(None)
+    else:
+        chats_cache.clear()
+
+def get_cache_stats() -> List[Dict[str, Any]]:
+    """Get size and hit-ratio metrics of the data layer caches."""
+    return [users_cache.stats(), chats_cache.stats()]
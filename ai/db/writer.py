@@ -0,0 +1,241 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Union
+from pymongo import InsertOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+from pymongo.results import BulkWriteResult
+from pymongo.write_concern import WriteConcern
+from ai.db.mongodb import get_db, invalidate_users, invalidate_chats
+
+AGENT_RESULTS_COLLECTION = "agent_results"
+
+MAX_BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.5
+DUPLICATE_KEY_ERROR = 11000
+
+WriteOp = Any  # pymongo InsertOne / UpdateOne / ReplaceOne / DeleteOne ...
+
+def _collection(db, name: str, unacknowledged: bool = False) -> Collection:
+    collection = db[name]
+    if unacknowledged:
+        # w=0: fire-and-forget, the server sends no reply. Only for telemetry-like data.
+        collection = collection.with_options(write_concern=WriteConcern(w=0))
+    return collection
+
+def _after_write(name: str) -> None:
+    """Keep the read caches coherent with writes made through this module."""
+    if name == "users":
+        invalidate_users()
+    elif name == "chats":
+        invalidate_chats()
+
+def bulk_write(collection: str, ops: List[WriteOp], ordered: bool = True,
+               unacknowledged: bool = False, db=None) -> Optional[BulkWriteResult]:
+    """
+    Send a list of write operations to a collection in one round trip.
+    With ordered=True the server applies them in order and stops at the first error.
+    """
+    if not ops:
+        return None
+    db = db if db is not None else get_db()
+    result = _collection(db, collection, unacknowledged).bulk_write(ops, ordered=ordered)
+    _after_write(collection)
+    return result
+
+def insert_many(collection: str, docs: List[Dict[str, Any]], ordered: bool = True,
+                unacknowledged: bool = False, db=None) -> List[Any]:
+    """Insert documents in one round trip. Returns the inserted _ids."""
+    if not docs:
+        return []
+    db = db if db is not None else get_db()
+    result = _collection(db, collection, unacknowledged).insert_many(docs, ordered=ordered)
+    _after_write(collection)
+    return result.inserted_ids if result.acknowledged else []
+
+def insert_messages(messages: List[Dict[str, Any]], db=None) -> List[Any]:
+    """Insert chat messages, in order."""
+    return insert_many("messages", messages, ordered=True, db=db)
+
+def agent_result_doc(chat_id: str, agent: str, output: Union[str, Dict[str, Any], List[Any]],
+                     **fields: Any) -> Dict[str, Any]:
+    """
+    Build an agent_results document from an agent's output, e.g. the JSON string
+    returned by get_user_understanding(), design_workflow() or get_next_agent().
+    """
+    if isinstance(output, str):
+        try:
+            output = json.loads(output)
+        except json.JSONDecodeError:
+            pass
+    doc = {
+        "chatId": chat_id,
+        "agent": agent,
+        "result": output,
+        "createdAt": datetime.now(timezone.utc),
+    }
+    doc.update(fields)
+    return doc
+
+def save_agent_results(results: List[Dict[str, Any]], db=None) -> Optional[BulkWriteResult]:
+    """Save agent_results documents (see agent_result_doc) in one round trip."""
+    return bulk_write(AGENT_RESULTS_COLLECTION, [InsertOne(doc) for doc in results], ordered=True, db=db)
+
+class BufferedWriter:
+    """
+    Async write buffer that batches writes and flushes them when max_batch_size
+    operations are pending or flush_interval seconds have passed, whichever is first.
+
+    Writes of the same chat are applied in the order they were added, across
+    collections: each flush walks a chat's queue in order, sending one ordered
+    bulk_write per run of consecutive ops on the same collection, and stops at the
+    first failure so nothing added later is written ahead of it. Flushes never
+    overlap; different chats are written concurrently.
+
+    Collections listed in `unacknowledged` are written with w=0 and unordered,
+    for telemetry-like data where losing a write is acceptable.
+
+    When a batch fails, its unwritten ops go back to the front of their chat's queue
+    and are retried on the next flush, before anything added later. An op the server
+    rejects (e.g. a duplicate key) would fail forever, so it is moved to `failed`
+    instead. The exception is a retried insert rejected as a duplicate: its earlier
+    attempt was applied before the failure, so it counts as written.
+    close() raises if writes are still queued after the final flush.
+
+    Usage:
+        async with BufferedWriter() as writer:
+            await writer.add_message(message)
+            await writer.add_agent_result(chat_id, "workflow_designer", steps_json)
+    """
+
+    def __init__(self, max_batch_size: int = MAX_BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 unacknowledged: Optional[List[str]] = None, db=None):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.unacknowledged = set(unacknowledged or [])
+        self._db = db
+        # chat_id -> pending (collection, op, retried) entries, in insertion order
+        self._pending: Dict[Optional[str], List[tuple]] = {}
+        self._count = 0
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        self.failed: List[tuple] = []  # (collection, chat_id, op, error) rejected by the server
+
+    async def add(self, collection: str, op: Union[WriteOp, Dict[str, Any]], chat_id: Optional[str] = None) -> None:
+        """Queue a write. A plain document is queued as an insert."""
+        if isinstance(op, dict):
+            chat_id = chat_id if chat_id is not None else op.get("chatId")
+            op = InsertOne(op)
+        self._pending.setdefault(chat_id, []).append((collection, op, False))
+        self._count += 1
+        if self._count >= self.max_batch_size:
+            await self.flush()
+
+    async def add_message(self, message: Dict[str, Any]) -> None:
+        await self.add("messages", message)
+
+    async def add_agent_result(self, chat_id: str, agent: str, output: Any, **fields: Any) -> None:
+        await self.add(AGENT_RESULTS_COLLECTION, agent_result_doc(chat_id, agent, output, **fields))
+
+    async def flush(self) -> None:
+        """Write everything queued so far."""
+        async with self._flush_lock:
+            if not self._count:
+                return
+            self._last_flush = time.monotonic()
+            if self._db is None:
+                self._db = await asyncio.to_thread(get_db)
+            pending, self._pending, self._count = self._pending, {}, 0
+            await asyncio.gather(*(self._write_chat(chat_id, entries) for chat_id, entries in pending.items()))
+            self.flushes += 1
+
+    async def _write_chat(self, chat_id: Optional[str], entries: List[tuple]) -> None:
+        """Write one chat's queue in order; on failure requeue what wasn't written and stop."""
+        while entries:
+            collection = entries[0][0]
+            n = 1
+            while n < len(entries) and entries[n][0] == collection:
+                n += 1
+            run, rest = entries[:n], entries[n:]
+            try:
+                await self._write(collection, [op for _, op, _ in run])
+            except Exception as e:
+                write_errors = e.details.get("writeErrors") if isinstance(e, BulkWriteError) else None
+                if not write_errors:
+                    # Unknown outcome (e.g. AutoReconnect, a write concern error): some ops may
+                    # have been applied, so mark them as retried.
+                    self.errors += 1
+                    print(f"Buffered write to {collection} for chat {chat_id} failed: {e}")
+                    self._requeue(chat_id, [(c, op, True) for c, op, _ in run] + rest)
+                    return
+                # Ordered bulk write: ops before the failed one were applied, the failed
+                # one was rejected by the server, the rest were never sent.
+                index = write_errors[0]["index"]
+                self.written += index
+                _, op, retried = run[index]
+                entries = run[index + 1:] + rest
+                if retried and write_errors[0].get("code") == DUPLICATE_KEY_ERROR and isinstance(op, InsertOne):
+                    self.written += 1
+                    continue
+                self.errors += 1
+                print(f"Buffered write to {collection} for chat {chat_id} failed: {e}")
+                self.failed.append((collection, chat_id, op, write_errors[0]))
+                self._requeue(chat_id, entries)
+                return
+            self.written += len(run)
+            entries = rest
+
+    def _requeue(self, chat_id: Optional[str], entries: List[tuple]) -> None:
+        """Put unwritten ops back in front of anything queued for the same chat since the flush began."""
+        if entries:
+            self._pending[chat_id] = entries + self._pending.get(chat_id, [])
+            self._count += len(entries)
+
+    async def _write(self, collection: str, ops: List[WriteOp]) -> None:
+        if collection in self.unacknowledged:
+            await asyncio.to_thread(bulk_write, collection, ops, False, True, self._db)
+        else:
+            await asyncio.to_thread(bulk_write, collection, ops, True, False, self._db)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                try:
+                    # Shielded so close() cancelling this task doesn't drop a batch mid-write.
+                    await asyncio.shield(self.flush())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Keep flushing on time; failed writes stay queued for the next round.
+                    print(f"Buffered writer flush failed: {e}")
+
+    async def start(self) -> "BufferedWriter":
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def close(self) -> None:
+        """Stop the periodic flush and write whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._count:
+            raise RuntimeError(f"BufferedWriter closed with {self._count} unwritten operation(s); see the errors above.")
+
+    async def __aenter__(self) -> "BufferedWriter":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
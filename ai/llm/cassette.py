@@ -0,0 +1,224 @@
+"""
+Record/replay ("cassette") backend for run_inference.
+
+In record mode real provider responses are saved, with their timing, to a compact
+append-only file. In replay mode they are served from that file offline, with their
+original latency (or scaled, or none), so the agent pipeline can run with realistic
+timing on machines without network access or API keys.
+
+    from ai.llm.cassette import CassetteBackend
+    from ai.llm.inference import set_inference_backend
+    set_inference_backend(CassetteBackend("agents.cassette", mode="replay", latency_scale=1.0))
+
+Or through the environment, picked up when ai.llm.inference is imported:
+    LLM_CASSETTE_MODE=record|replay|auto  LLM_CASSETTE_PATH=agents.cassette  LLM_CASSETTE_LATENCY_SCALE=1.0
+
+File format: an 8-byte magic followed by records of
+    [32-byte sha256 request key][4-byte little-endian payload length][zlib-compressed JSON payload]
+The file is memory-mapped and only the record headers are scanned on open, so lookups
+decompress just the one payload they need. When a key is recorded twice the last record wins.
+"""
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from ai.tracing.tracer import current_span, set_attribute
+
+MAGIC = b"AICASS01"
+HEADER = struct.Struct("<32sI")  # request key, payload length
+
+MODES = ("record", "replay", "auto")
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+def request_key(messages: List[Dict[str, Any]], model_name: str) -> bytes:
+    """Hash of everything that determines a response: the model and the role/content of every message."""
+    canonical = json.dumps(
+        {"model": model_name, "messages": [[m.get("role"), m.get("content")] for m in messages]},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).digest()
+
+class Cassette:
+    """
+    Append-only, memory-mapped store of recorded responses keyed by request hash.
+    Read-only cassettes must exist; writable ones are created when missing.
+    """
+
+    def __init__(self, path: str, writable: bool = True):
+        self.path = path
+        self.writable = writable
+        self._index: Dict[bytes, Tuple[int, int]] = {}  # key -> (payload offset, payload length)
+        self._lock = threading.Lock()
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._open()
+
+    def _open(self) -> None:
+        if not self.writable:
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f"Cassette file not found: {self.path}")
+            self._file = open(self.path, "rb")
+        else:
+            exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+            self._file = open(self.path, "r+b" if exists else "w+b")
+            if not exists:
+                self._file.write(MAGIC)
+                self._file.flush()
+        self._file.seek(0)
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{self.path} is not a cassette file")
+        self._remap()
+        end = self._scan(len(MAGIC))
+        if self.writable and end < len(self._mmap):
+            # Drop the partial record so new records are appended right after the last valid one.
+            self._mmap.close()
+            self._mmap = None
+            self._file.truncate(end)
+            self._file.flush()
+            self._remap()
+
+    def _remap(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _scan(self, offset: int) -> int:
+        """Index the records from offset on. Returns the end offset of the last complete record."""
+        end = len(self._mmap)
+        while offset + HEADER.size <= end:
+            key, length = HEADER.unpack_from(self._mmap, offset)
+            payload_offset = offset + HEADER.size
+            if payload_offset + length > end:
+                # Truncated last record (e.g. interrupted while recording); ignore it.
+                break
+            self._index[key] = (payload_offset, length)
+            offset = payload_offset + length
+        return offset
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            offset, length = entry
+            if offset + length > len(self._mmap):
+                self._remap()
+            payload = self._mmap[offset:offset + length]
+        return json.loads(zlib.decompress(payload))
+
+    def put(self, key: bytes, record: Dict[str, Any]) -> None:
+        if not self.writable:
+            raise ValueError(f"Cassette {self.path} is open read-only")
+        payload = zlib.compress(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            offset = self._file.seek(0, os.SEEK_END)
+            self._file.write(HEADER.pack(key, len(payload)) + payload)
+            self._file.flush()
+            self._index[key] = (offset + HEADER.size, len(payload))
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class CassetteBackend:
+    """
+    Inference backend (see set_inference_backend) that records or replays responses.
+
+    Modes:
+        record: call the provider, save the response, return it
+        replay: serve recorded responses only; raise CassetteMiss for unknown requests
+        auto:   replay when recorded, otherwise record
+
+    latency_scale multiplies the recorded latency on replay: 1.0 replays the original
+    timing, 0 serves immediately.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", latency_scale: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}. Use one of {', '.join(MODES)}.")
+        self.mode = mode
+        self.latency_scale = latency_scale
+        # Replay never writes, so a missing or mistyped path fails here instead of creating an empty cassette.
+        self.cassette = Cassette(path, writable=mode != "replay")
+        self.name = f"cassette-{mode}"
+
+    def _record(self, key: bytes, messages: List[Dict[str, Any]], model_name: str) -> str:
+        from ai.llm.inference import call_provider
+
+        start = time.monotonic()
+        response = call_provider(messages, model_name)
+        latency = time.monotonic() - start
+        span = current_span()
+        attributes = span.attributes if span is not None else {}
+        # run_inference has no streaming path yet, so a response is a single chunk
+        # that arrives after the full latency. The format keeps a chunk list so
+        # streamed responses can be stored as [seconds since request, text] pairs.
+        self.cassette.put(key, {
+            "model": model_name,
+            "latency": latency,
+            "chunks": [[latency, response]],
+            "input_tokens": attributes.get("llm.input_tokens"),
+            "output_tokens": attributes.get("llm.output_tokens"),
+            "recorded_at": time.time(),
+        })
+        return response
+
+    def stream(self, messages: List[Dict[str, Any]], model_name: str) -> Iterator[str]:
+        """Replay a recorded response chunk by chunk, each at its recorded (scaled) time."""
+        record = self._lookup(request_key(messages, model_name), model_name)
+        return self._replay(record)
+
+    def _replay(self, record: Dict[str, Any]) -> Iterator[str]:
+        start = time.monotonic()
+        for at, text in record["chunks"]:
+            delay = at * self.latency_scale - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+            yield text
+
+    def _lookup(self, key: bytes, model_name: str) -> Dict[str, Any]:
+        record = self.cassette.get(key)
+        if record is None:
+            raise CassetteMiss(f"No recorded response for this {model_name} request in {self.cassette.path}. "
+                               "Record it first with mode='record' or 'auto'.")
+        if record.get("input_tokens") is not None:
+            set_attribute("llm.input_tokens", record["input_tokens"])
+        if record.get("output_tokens") is not None:
+            set_attribute("llm.output_tokens", record["output_tokens"])
+        set_attribute("llm.recorded_latency_ms", record["latency"] * 1000)
+        return record
+
+    def __call__(self, messages: List[Dict[str, Any]], model_name: str) -> str:
+        key = request_key(messages, model_name)
+        if self.mode == "record" or (self.mode == "auto" and key not in self.cassette):
+            set_attribute("llm.cassette", "record")
+            return self._record(key, messages, model_name)
+        set_attribute("llm.cassette", "replay")
+        return "".join(self._replay(self._lookup(key, model_name)))
+
+def backend_from_env() -> Optional[CassetteBackend]:
+    """Build a CassetteBackend from LLM_CASSETTE_MODE / LLM_CASSETTE_PATH / LLM_CASSETTE_LATENCY_SCALE, if set."""
+    mode = os.getenv("LLM_CASSETTE_MODE")
+    if not mode:
+        return None
+    path = os.getenv("LLM_CASSETTE_PATH", "llm.cassette")
+    scale = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "1.0"))
+    return CassetteBackend(path, mode=mode, latency_scale=scale)
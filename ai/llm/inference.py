@@ -1,9 +1,12 @@
 # llm_models.py
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
 import google.generativeai as genai
 from openai import OpenAI
 from anthropic import Anthropic
+from ai.llm.messages import compile_messages
+from ai.tracing.tracer import traced, start_span, set_attribute
+from ai.llm.cassette import backend_from_env
 
 # --- Configuration ---
 # Ensure your API keys are set as environment variables:
@@ -39,9 +42,41 @@ model_name_mapping = {
     }
 }
 
+# --- Inference backend ---
+# By default run_inference() calls the provider APIs (call_provider). A backend can be set
+# to serve responses from somewhere else, e.g. the fake backend of the load generator.
+# A backend is any callable (messages, model_name) -> str.
+# Setting LLM_CASSETTE_MODE starts with a record/replay backend (see ai/llm/cassette.py).
+InferenceBackend = Callable[[list[dict], str], str]
+
+_backend: Optional[InferenceBackend] = backend_from_env()
+
+def set_inference_backend(backend: Optional[InferenceBackend]) -> Optional[InferenceBackend]:
+    """Route run_inference() through backend (None restores the provider APIs). Returns the previous backend."""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
+def get_inference_backend() -> Optional[InferenceBackend]:
+    return _backend
+
+@traced("llm.run_inference")
 def run_inference(messages: list[dict], model_name: str) -> str:
     """
-    Runs inference on a list of messages using the specified model.
+    Runs inference on a list of messages using the specified model,
+    through the configured backend if one is set (see set_inference_backend).
+    """
+    backend = _backend
+    if backend is not None:
+        set_attribute("llm.backend", getattr(backend, "name", type(backend).__name__))
+        set_attribute("llm.model", model_name)
+        set_attribute("llm.messages", len(messages))
+        return backend(messages, model_name)
+    return call_provider(messages, model_name)
+
+def call_provider(messages: list[dict], model_name: str) -> str:
+    """
+    Runs inference on a list of messages using the specified model's provider API.
 
     Args:
         messages: A list of message dictionaries, where each dictionary
@@ -71,6 +106,9 @@ def run_inference(messages: list[dict], model_name: str) -> str:
     else:
         raise ValueError(f"Could not determine provider for model: {model_name}. "
                          "Ensure model_name includes 'gemini', 'gpt', or 'claude'.")
+    set_attribute("llm.provider", provider)
+    set_attribute("llm.model", model_name)
+    set_attribute("llm.messages", len(messages))
 
     try:
         if provider == "google":
@@ -79,43 +117,24 @@ def run_inference(messages: list[dict], model_name: str) -> str:
                 raise ValueError("GOOGLE_API_KEY environment variable not set.")
             genai.configure(api_key=api_key)
             
-            model = genai.GenerativeModel(model_name)
-
-            # Convert messages to Google's format
-            # Google expects roles 'user' and 'model'. System prompts are handled differently
-            # or can be part of the first user message.
-            # For simplicity, we'll assume alternating user/model roles and no explicit system prompt here.
-            # A more robust conversion would be needed for complex scenarios.
-            chat_history_for_google = []
-            for msg in messages:
-                # Gemini API expects 'model' for assistant role.
-                role = "model" if msg["role"].lower() == "assistant" else msg["role"].lower()
-                role = "user" if role == "system" else role
-                # Ensure roles are only 'user' or 'model'
-                if role not in ["user", "model"]:
-                    print(f"Warning: Skipping message with unhandled role '{msg['role']}' for Gemini.")
-                    continue
-                chat_history_for_google.append({
-                    "role": role,
-                    "parts": [msg["content"]]
-                })
-            
-            # Ensure history starts with 'user' if not empty, or handle appropriately
-            if not chat_history_for_google or chat_history_for_google[0]['role'] != 'user':
-                 # This is a simplified handling. Production code might prepend a user message
-                 # or raise an error if the sequence is not valid for the API.
-                 # For now, we'll attempt to send what we have, but Gemini API is strict.
-                 print("Warning: Gemini chat history should ideally start with a 'user' role.")
+            # Roles are mapped to 'user'/'model' and the system prompt is passed as
+            # system_instruction (see ai/llm/messages.py).
+            with start_span("llm.compile_messages"):
+                system_instruction, chat_history_for_google = compile_messages(messages, "google")
+            model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
 
-
-            # If the last message was from the 'model', Gemini might not respond as expected
-            # if we are asking it to continue. For a fresh user query, the last message should be 'user'.
-            # This example assumes the last message in `messages` is the one to respond to.
-            
             if not chat_history_for_google:
                 return "Error: No valid messages to send to Gemini."
 
-            response = model.generate_content(chat_history_for_google)
+            if chat_history_for_google[0]['role'] != 'user':
+                 print("Warning: Gemini chat history should ideally start with a 'user' role.")
+
+            with start_span("llm.provider_call"):
+                response = model.generate_content(chat_history_for_google)
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                set_attribute("llm.input_tokens", usage.prompt_token_count)
+                set_attribute("llm.output_tokens", usage.candidates_token_count)
             return response.text
 
         elif provider == "openai":
@@ -126,10 +145,14 @@ def run_inference(messages: list[dict], model_name: str) -> str:
 
             # OpenAI messages format is [{role: "user", content: "..."}, {role: "assistant", ...}]
             # System messages are also supported as the first message.
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages # Directly use the input messages
-            )
+            with start_span("llm.provider_call"):
+                response = client.chat.completions.create(
+                    model=model_name,
+                    messages=messages # Directly use the input messages
+                )
+            if response.usage is not None:
+                set_attribute("llm.input_tokens", response.usage.prompt_tokens)
+                set_attribute("llm.output_tokens", response.usage.completion_tokens)
             return response.choices[0].message.content
 
         elif provider == "anthropic":
@@ -138,31 +161,22 @@ def run_inference(messages: list[dict], model_name: str) -> str:
                 raise ValueError("ANTHROPIC_API_KEY environment variable not set.")
             client = Anthropic(api_key=api_key)
 
-            system_prompt = None
-            processed_messages = []
-            if messages and messages[0]["role"].lower() == "system":
-                system_prompt = messages[0]["content"]
-                processed_messages = messages[1:]
-            else:
-                processed_messages = messages
-            
-            # Ensure roles are 'user' or 'assistant' for Anthropic messages array
-            anthropic_messages = []
-            for msg in processed_messages:
-                if msg["role"].lower() in ["user", "assistant"]:
-                    anthropic_messages.append(msg)
-                else:
-                    print(f"Warning: Skipping message with unhandled role '{msg['role']}' for Anthropic.")
+            # System messages go to the `system` parameter; roles are 'user' or 'assistant'.
+            with start_span("llm.compile_messages"):
+                system_prompt, anthropic_messages = compile_messages(messages, "anthropic")
             
             if not anthropic_messages:
                  return "Error: No valid user/assistant messages to send to Anthropic."
 
-            response = client.messages.create(
-                model=model_name,
-                max_tokens=2048, # You might want to make this configurable
-                system=system_prompt if system_prompt else None, # Pass system prompt if it exists
-                messages=anthropic_messages
-            )
+            with start_span("llm.provider_call"):
+                response = client.messages.create(
+                    model=model_name,
+                    max_tokens=2048, # You might want to make this configurable
+                    **({"system": system_prompt} if system_prompt else {}), # Pass system prompt if it exists
+                    messages=anthropic_messages
+                )
+            set_attribute("llm.input_tokens", response.usage.input_tokens)
+            set_attribute("llm.output_tokens", response.usage.output_tokens)
             return response.content[0].text
 
     except ValueError as ve: # Catch our own ValueErrors for API keys etc.
@@ -216,10 +230,8 @@ def test_llm_models():
 
     # Test Google Gemini
     # Note: The Gemini example below uses `sample_messages_user_query`.
-    # For `sample_messages_with_system_and_history`, the system prompt handling for Gemini
-    # would need to be more explicitly managed (e.g., prepended to the first user message
-    # or handled via specific API features if available for system instructions).
-    # The current Gemini message conversion is basic.
+    # `sample_messages_with_system_and_history` works too; its system prompt is passed
+    # as the model's system_instruction.
     # if os.getenv("GOOGLE_API_KEY"):
     #     try:
     #         print(f"\n--- Testing Google Gemini ({test_model_google}) ---")
@@ -0,0 +1,157 @@
+import threading
+import json
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, NamedTuple
+
+# --- Normalized message representation ---
+# Every agent sends [{"role": "system", "content": SYSTEM}] + history to run_inference,
+# so within one turn the same history is converted up to four times, once per agent.
+# For the providers that need a conversion (Anthropic, Gemini) we split the system prompt
+# from the conversation, and compile the conversation into the provider's wire format
+# only once, memoized by the conversation's content. OpenAI takes the messages as they are.
+
+MEMO_SIZE = 128
+
+ROLE_ALIASES = {
+    "system": "system",
+    "developer": "system",
+    "user": "user",
+    "human": "user",
+    "assistant": "assistant",
+    "ai": "assistant",
+    "model": "assistant",
+}
+
+class Message(NamedTuple):
+    role: str  # "user" or "assistant"
+    content: Any  # a string, or a list of content blocks
+
+class NormalizedHistory(NamedTuple):
+    system: Optional[str]
+    messages: Tuple[Message, ...]
+
+def _content_text(content: Any) -> str:
+    """Plain text of a message's content: a string, or the text of its text blocks."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for block in content:
+            if isinstance(block, str):
+                parts.append(block)
+            elif isinstance(block, dict) and "text" in block:
+                parts.append(block["text"])
+            else:
+                parts.append(json.dumps(block, ensure_ascii=False, sort_keys=True, default=str))
+        return "\n".join(parts)
+    return json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+
+def normalize(messages: List[Dict[str, Any]]) -> NormalizedHistory:
+    """
+    Normalize a list of {'role', 'content'} dicts.
+    System messages (anywhere in the list) are joined into a single system prompt;
+    messages with roles no provider understands are skipped. Content is kept as is.
+    """
+    system_parts = []
+    conversation = []
+    for msg in messages:
+        role = ROLE_ALIASES.get(str(msg.get("role", "")).lower())
+        if role is None:
+            print(f"Warning: Skipping message with unhandled role '{msg.get('role')}'.")
+            continue
+        content = msg.get("content", "")
+        if role == "system":
+            system_parts.append(_content_text(content))
+        else:
+            conversation.append(Message(role, content))
+    system = "\n\n".join(system_parts) if system_parts else None
+    return NormalizedHistory(system, tuple(conversation))
+
+def history_key(messages: List[Dict[str, Any]]) -> Tuple[Tuple[Any, ...], ...]:
+    """
+    Hashable identity of a message list. String hashes are cached by Python, so this is cheap to rebuild.
+    Other content is keyed on its JSON form with a type tag, so "a\nb" and a list of
+    blocks with the same text (or with different block options) never share a key.
+    """
+    key = []
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            key.append((msg.get("role"), "str", content))
+        else:
+            key.append((msg.get("role"), type(content).__name__,
+                        json.dumps(content, sort_keys=True, default=str)))
+    return tuple(key)
+
+# --- Provider wire formats ---
+
+def _to_anthropic(history: NormalizedHistory) -> List[Dict[str, Any]]:
+    # Anthropic takes {"role": "user" | "assistant", "content": str | [content blocks]}.
+    return [{"role": m.role, "content": m.content} for m in history.messages]
+
+def _to_google_parts(content: Any) -> List[Any]:
+    if isinstance(content, list):
+        return [block["text"] if isinstance(block, dict) and "text" in block else
+                block if isinstance(block, str) else
+                json.dumps(block, ensure_ascii=False, sort_keys=True, default=str)
+                for block in content]
+    return [content if isinstance(content, str) else _content_text(content)]
+
+def _to_google(history: NormalizedHistory) -> List[Dict[str, Any]]:
+    # Gemini expects 'model' for the assistant role and a list of parts.
+    return [{"role": "model" if m.role == "assistant" else "user", "parts": _to_google_parts(m.content)}
+            for m in history.messages]
+
+_COMPILERS = {
+    "anthropic": _to_anthropic,
+    "google": _to_google,
+}
+
+_memo: "OrderedDict[Tuple[str, tuple], Tuple[Optional[str], List[Dict[str, Any]]]]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+def _compile_history(history: List[Dict[str, Any]], provider: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    memo_key = (provider, history_key(history))
+    with _memo_lock:
+        compiled = _memo.get(memo_key)
+        if compiled is not None:
+            _memo.move_to_end(memo_key)
+            return compiled
+    normalized = normalize(history)
+    compiled = (normalized.system, _COMPILERS[provider](normalized))
+    with _memo_lock:
+        _memo[memo_key] = compiled
+        if len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return compiled
+
+def compile_messages(messages: List[Dict[str, Any]], provider: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Compile messages into a provider's wire format.
+
+    Returns (system, messages):
+        - openai:    (None, messages) unchanged; system messages stay where they are.
+        - anthropic: system goes to the `system` parameter.
+        - google:    system goes to GenerativeModel(system_instruction=...).
+
+    The leading system prompt(s) are peeled off before memoization, so agents that
+    send different system prompts over the same history share one compiled history.
+    The returned message list may be shared between calls; don't mutate it.
+    """
+    if provider == "openai":
+        return None, messages
+    if provider not in _COMPILERS:
+        raise ValueError(f"Unknown provider: {provider}")
+    head = 0
+    while head < len(messages) and ROLE_ALIASES.get(str(messages[head].get("role", "")).lower()) == "system":
+        head += 1
+    system_parts = [_content_text(m.get("content", "")) for m in messages[:head]]
+    history_system, conversation = _compile_history(messages[head:], provider)
+    if history_system is not None:
+        system_parts.append(history_system)
+    system = "\n\n".join(system_parts) if system_parts else None
+    return system, conversation
+
+def clear_memo() -> None:
+    with _memo_lock:
+        _memo.clear()
@@ -0,0 +1,85 @@
+import json
+import time
+import random
+import threading
+from typing import Dict, Optional
+from ai.tracing.tracer import set_attribute
+
+# Canned responses that each agent can parse, keyed by a phrase of the agent's system prompt.
+FAKE_RESPONSES: Dict[str, str] = {
+    "VibeFlows User Understanding Agent": json.dumps({
+        "user_understanding": "Non-technical operations manager",
+        "problem_understanding": "Wants new leads from Google Sheets summarized and sent to Slack",
+        "workflow_tech_understanding": "Uses Google Sheets and Slack",
+        "user_tech_list": ["google-sheets", "slack"],
+        "required_tech_list": ["google-sheets", "openai", "slack"],
+        "user_last_message_intent": "Providing workflow details",
+        "clarification_questions": [],
+        "is_user_clarification_needed": False,
+        "is_workflow_design_approved": False,
+        "is_workflow_build_approved": False,
+        "do_we_have_enough_information_to_develop_workflow": False,
+        "do_we_have_enough_information_to_design_workflow": True,
+        "do_we_have_enough_information_to_run_workflow": False,
+    }),
+    "VibeFlows Next Agent Selector": json.dumps({
+        "next_agent": "workflow_designer",
+        "reason": "Enough information to design the workflow",
+        "is_workflow_design_approved": False,
+        "is_workflow_build_approved": False,
+        "do_we_have_enough_information_to_develop_workflow": False,
+        "do_we_have_enough_information_to_design_workflow": True,
+        "do_we_have_enough_information_to_run_workflow": False,
+    }),
+    "VibeFlows Workflow Designer Agent": json.dumps([
+        {"label": "Read Leads Data", "description": "Reads leads data from Google Sheets", "integrations": ["google-sheets"]},
+        {"label": "Summarize Leads", "description": "Summarizes new leads", "integrations": ["openai"]},
+        {"label": "Notify Team", "description": "Posts the summary to Slack", "integrations": ["slack"]},
+    ]),
+    "VibeFlows UI Agent": "Great, I can build that for you. Shall I go ahead and design the workflow?",
+}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for load modelling."""
+    return max(1, len(text) // 4)
+
+class FakeBackend:
+    """
+    Inference backend that answers without calling a provider, for load tests.
+
+    Each agent gets a canned response it can parse. Latency is modelled as
+    base_latency + output tokens / tokens_per_second, with lognormal jitter, and a
+    fraction of calls (error_rate) raise to exercise the agents' retry paths.
+    """
+    name = "fake"
+
+    def __init__(self, base_latency: float = 0.3, tokens_per_second: float = 80.0,
+                 jitter: float = 0.25, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.base_latency = base_latency
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _response_for(self, messages: list[dict]) -> str:
+        system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        for phrase, response in FAKE_RESPONSES.items():
+            if phrase in system:
+                return response
+        return "OK"
+
+    def __call__(self, messages: list[dict], model_name: str) -> str:
+        response = self._response_for(messages)
+        input_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+        output_tokens = estimate_tokens(response)
+        with self._lock:
+            noise = self._random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+            fail = self._random.random() < self.error_rate
+
+        time.sleep((self.base_latency + output_tokens / self.tokens_per_second) * noise)
+        set_attribute("llm.input_tokens", input_tokens)
+        if fail:
+            raise RuntimeError("Fake backend: injected provider error")
+        set_attribute("llm.output_tokens", output_tokens)
+        return response
@@ -0,0 +1,373 @@
+"""
+Load generator: replays recorded chats through the agent stack.
+
+Every user message of a recorded chat becomes one turn:
+    get_user_understanding -> get_next_agent -> design_workflow or the UI agent
+run on the chat history up to that message.
+
+Usage:
+    python -m ai.loadgen.run --backend fake --mode closed --concurrency 8 --duration 60 --warmup 10
+    python -m ai.loadgen.run --backend fake --mode open --rate 5 --duration 60
+    python -m ai.loadgen.run --chats-file chats.json --backend real --turns 50
+    python -m ai.loadgen.run --dump-chats chats.json --limit-chats 100
+    python -m ai.loadgen.run --chats-file chats.json --backend record --cassette agents.cassette --turns 20
+    python -m ai.loadgen.run --chats-file chats.json --backend replay --cassette agents.cassette --latency-scale 1.0
+
+Chats are read from the `chats`/`messages` collections, or from a JSON file written
+with --dump-chats ([{"chatId": ..., "messages": [{"role": ..., "content": ...}]}]).
+
+Modes:
+    closed: `concurrency` workers each run turns back to back (throughput at a fixed load).
+    open:   turns start at a fixed `rate` per second whatever the completions
+            (latency at a fixed arrival rate). Latency is measured from the scheduled
+            start, so queueing delay when the stack falls behind is included.
+            At most `concurrency` turns run at once; arrivals beyond that wait in a
+            client-side queue, and the report counts them. Size --concurrency above
+            rate x expected latency to keep the run truly open-loop.
+
+Turns started during the warm-up period are run but left out of the report.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from ai.agents.user_understanding import get_user_understanding
+from ai.agents.next_agent import get_next_agent
+from ai.agents.workflow_designer import design_workflow
+from ai.agents.user_interface import get_user_ineterface_reponse
+from ai.llm.inference import set_inference_backend
+from ai.llm.cassette import CassetteBackend
+from ai.loadgen.backends import FakeBackend
+from ai.tracing.tracer import start_span, add_exporter, remove_exporter, InMemorySpanExporter
+from ai.tracing.summarize import percentile
+
+Turn = List[Dict[str, Any]]  # chat history up to and including a user message
+
+# --- Chats ---
+
+def _to_message(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    role = doc.get("role")
+    content = doc.get("content")
+    if not role or content is None:
+        return None
+    return {"role": role, "content": content}
+
+def load_chats_from_db(limit: int = 0) -> List[Dict[str, Any]]:
+    from ai.db.mongodb import get_all_chats, get_all_messages
+
+    chats = []
+    for chat in get_all_chats():
+        chat_id = str(chat["_id"])
+        docs = sorted(get_all_messages(chat_id), key=lambda d: d["_id"])
+        messages = [m for m in (_to_message(d) for d in docs) if m]
+        if messages:
+            chats.append({"chatId": chat_id, "messages": messages})
+            if limit and len(chats) >= limit:
+                break
+    return chats
+
+def load_chats_from_file(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def chats_to_turns(chats: List[Dict[str, Any]]) -> List[Turn]:
+    turns = []
+    for chat in chats:
+        messages = chat["messages"]
+        for i, message in enumerate(messages):
+            if message["role"] == "user":
+                turns.append(messages[:i + 1])
+    return turns
+
+# --- Agent pipeline ---
+
+def run_turn(history: Turn) -> str:
+    """Run one chat turn through the agents, the way the app does. Returns the agent that answered."""
+    with start_span("loadgen.turn", {"loadgen.history_length": len(history)}):
+        # Agents append retry notes to the list they are given, so each gets its own copy.
+        understanding = get_user_understanding(list(history))
+        with_understanding = list(history) + [{"role": "assistant", "content": understanding}]
+        next_agent = json.loads(get_next_agent(list(with_understanding)))["next_agent"]
+        if next_agent == "workflow_designer":
+            design_workflow(list(with_understanding))
+            return "workflow_designer"
+        get_user_ineterface_reponse(list(with_understanding))
+        return "user_interface"
+
+class TurnResult:
+    __slots__ = ("scheduled", "started", "finished", "error", "trace_id")
+
+    def __init__(self, scheduled: float):
+        self.scheduled = scheduled
+        self.started = 0.0
+        self.finished = 0.0
+        self.error: Optional[str] = None
+        self.trace_id: Optional[str] = None
+
+class LoadGenerator:
+    def __init__(self, turns: List[Turn], mode: str = "closed", concurrency: int = 4,
+                 rate: float = 1.0, duration: float = 60.0, max_turns: int = 0, warmup: float = 0.0):
+        if not turns:
+            raise ValueError("No turns to replay: the chats contain no user messages.")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        if mode == "open" and rate <= 0:
+            raise ValueError("rate must be greater than 0 in open mode.")
+        self.turns = turns
+        self.mode = mode
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.max_turns = max_turns
+        self.warmup = warmup
+        self.results: List[TurnResult] = []
+        self._lock = threading.Lock()
+        self._next = 0
+        self._in_flight = 0
+        self.client_queued = 0  # open mode: arrivals that found every worker busy
+        self.start_time = 0.0
+
+    def _take(self) -> Optional[Turn]:
+        with self._lock:
+            if self.max_turns and self._next >= self.max_turns:
+                return None
+            turn = self.turns[self._next % len(self.turns)]
+            self._next += 1
+            return turn
+
+    def _execute(self, turn: Turn, result: TurnResult) -> None:
+        result.started = time.monotonic()
+        try:
+            with start_span("loadgen.request") as span:
+                result.trace_id = span.trace_id
+                run_turn(turn)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.finished = time.monotonic()
+        with self._lock:
+            self.results.append(result)
+            self._in_flight -= 1
+
+    def _closed_worker(self, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            turn = self._take()
+            if turn is None:
+                return
+            with self._lock:
+                self._in_flight += 1
+            self._execute(turn, TurnResult(time.monotonic()))
+
+    def run(self) -> None:
+        self.start_time = time.monotonic()
+        deadline = self.start_time + self.duration
+        if self.mode == "closed":
+            threads = [threading.Thread(target=self._closed_worker, args=(deadline,), daemon=True)
+                       for _ in range(self.concurrency)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            return
+
+        interval = 1.0 / self.rate
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            i = 0
+            while True:
+                scheduled = self.start_time + i * interval
+                if scheduled >= deadline:
+                    break
+                turn = self._take()
+                if turn is None:
+                    break
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                with self._lock:
+                    if self._in_flight >= self.concurrency:
+                        self.client_queued += 1
+                    self._in_flight += 1
+                pool.submit(self._execute, turn, TurnResult(scheduled))
+                i += 1
+
+# --- Report ---
+
+AGENT_SPANS = ("agent.user_understanding", "agent.next_agent", "agent.workflow_designer", "agent.user_interface")
+
+def build_report(gen: LoadGenerator, spans: List[Any]) -> Dict[str, Any]:
+    warmup_end = gen.start_time + gen.warmup
+    measured = [r for r in gen.results if r.scheduled >= warmup_end]
+    ok = [r for r in measured if r.error is None]
+    # Open loop: latency from the scheduled arrival, so queueing is counted.
+    latencies = [(r.finished - r.scheduled) * 1000 for r in ok]
+    window = (max((r.finished for r in measured), default=warmup_end) - warmup_end) or 1e-9
+
+    measured_traces = {r.trace_id for r in measured}
+    by_id = {s.span_id: s for s in spans}
+
+    def agent_of(span) -> Optional[str]:
+        while span is not None:
+            if span.name in AGENT_SPANS:
+                return span.name
+            span = by_id.get(span.parent_span_id)
+        return None
+
+    agents: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+        "calls": 0, "attempts": 0, "latencies_ms": [], "inference_calls": 0, "inference_errors": 0,
+        "input_tokens": 0, "output_tokens": 0,
+    })
+    for span in spans:
+        if span.trace_id not in measured_traces:
+            continue
+        if span.name in AGENT_SPANS:
+            a = agents[span.name]
+            a["calls"] += 1
+            a["attempts"] += span.attributes.get("agent.attempts", 1)
+            a["latencies_ms"].append(span.duration_ms)
+        elif span.name == "llm.run_inference":
+            name = agent_of(span)
+            if name is None:
+                continue
+            a = agents[name]
+            a["inference_calls"] += 1
+            a["inference_errors"] += span.status == "ERROR"
+            a["input_tokens"] += span.attributes.get("llm.input_tokens", 0) or 0
+            a["output_tokens"] += span.attributes.get("llm.output_tokens", 0) or 0
+
+    agent_report = {}
+    total_calls = total_retries = 0
+    for name in AGENT_SPANS:
+        if name not in agents:
+            continue
+        a = agents[name]
+        retries = a["attempts"] - a["calls"]
+        total_calls += a["calls"]
+        total_retries += retries
+        agent_report[name] = {
+            "calls": a["calls"],
+            "retry_rate": retries / a["calls"] if a["calls"] else 0.0,
+            "inference_error_rate": a["inference_errors"] / a["inference_calls"] if a["inference_calls"] else 0.0,
+            "p50_ms": percentile(a["latencies_ms"], 50),
+            "p95_ms": percentile(a["latencies_ms"], 95),
+            "input_tokens": a["input_tokens"],
+            "output_tokens": a["output_tokens"],
+            "tokens_per_call": (a["input_tokens"] + a["output_tokens"]) / a["calls"] if a["calls"] else 0.0,
+        }
+
+    return {
+        "mode": gen.mode,
+        "concurrency": gen.concurrency,
+        "rate": gen.rate if gen.mode == "open" else None,
+        "client_queued": gen.client_queued if gen.mode == "open" else None,
+        "turns": len(measured),
+        "warmup_turns": len(gen.results) - len(measured),
+        "errors": len(measured) - len(ok),
+        "error_rate": (len(measured) - len(ok)) / len(measured) if measured else 0.0,
+        "retry_rate": total_retries / total_calls if total_calls else 0.0,
+        "throughput_per_s": len(ok) / window,
+        "latency_ms": {q: percentile(latencies, q) for q in (50, 90, 95, 99)},
+        "latency_max_ms": max(latencies, default=0.0),
+        "agents": agent_report,
+        "error_samples": sorted({r.error for r in measured if r.error})[:5],
+    }
+
+def format_report(report: Dict[str, Any]) -> str:
+    lat = report["latency_ms"]
+    if report["mode"] == "open":
+        load = (f"rate {report['rate']}/s, at most {report['concurrency']} in flight, "
+                f"{report['client_queued']} arrival(s) queued client-side")
+    else:
+        load = f"concurrency {report['concurrency']}"
+    lines = [
+        f"Mode: {report['mode']} ({load})",
+        f"Turns: {report['turns']} measured, {report['warmup_turns']} warm-up",
+        f"Throughput: {report['throughput_per_s']:.2f} turns/s",
+        f"Latency ms: p50 {lat[50]:.0f}  p90 {lat[90]:.0f}  p95 {lat[95]:.0f}  p99 {lat[99]:.0f}  max {report['latency_max_ms']:.0f}",
+        f"Errors: {report['errors']} ({report['error_rate']:.1%})   Agent retry rate: {report['retry_rate']:.1%}",
+        "",
+        f"{'agent':<26} {'calls':>6} {'retry':>7} {'inf err':>8} {'p50 ms':>8} {'p95 ms':>8} {'in tok':>9} {'out tok':>9} {'tok/call':>9}",
+    ]
+    for name, a in report["agents"].items():
+        lines.append(
+            f"{name:<26} {a['calls']:>6} {a['retry_rate']:>6.1%} {a['inference_error_rate']:>7.1%} "
+            f"{a['p50_ms']:>8.0f} {a['p95_ms']:>8.0f} {a['input_tokens']:>9} {a['output_tokens']:>9} {a['tokens_per_call']:>9.0f}"
+        )
+    for error in report["error_samples"]:
+        lines.append(f"  error: {error}")
+    return "\n".join(lines)
+
+# --- CLI ---
+
+def make_backend(args):
+    if args.backend == "fake":
+        return FakeBackend(base_latency=args.fake_latency, tokens_per_second=args.fake_tokens_per_second,
+                           error_rate=args.fake_error_rate, seed=args.seed)
+    if args.backend in ("record", "replay", "auto"):
+        return CassetteBackend(args.cassette, mode=args.backend, latency_scale=args.latency_scale)
+    return None  # real providers
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded chats against the agent stack.")
+    parser.add_argument("--chats-file", help="Read chats from this JSON file instead of MongoDB")
+    parser.add_argument("--dump-chats", metavar="PATH", help="Write the chats from MongoDB to PATH and exit")
+    parser.add_argument("--limit-chats", type=int, default=0)
+    parser.add_argument("--backend", choices=["real", "fake", "record", "replay", "auto"], default="fake",
+                        help="record/replay/auto use the cassette in --cassette (see ai/llm/cassette.py)")
+    parser.add_argument("--cassette", default="llm.cassette", help="Cassette file for record/replay/auto")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Replay recorded latencies scaled by this factor (0 = no delay)")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Workers (closed) or max in-flight turns before arrivals queue client-side (open)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Turns started per second (open mode)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to generate load for")
+    parser.add_argument("--turns", type=int, default=0, help="Stop after this many turns")
+    parser.add_argument("--warmup", type=float, default=0.0, help="Seconds of turns to leave out of the report")
+    parser.add_argument("--fake-latency", type=float, default=0.3, help="Fake backend base latency in seconds")
+    parser.add_argument("--fake-tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Keep the agents' and providers' output")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.mode == "open" and args.rate <= 0:
+        parser.error("--rate must be greater than 0")
+
+    if args.dump_chats:
+        chats = load_chats_from_db(args.limit_chats)
+        with open(args.dump_chats, "w", encoding="utf-8") as f:
+            json.dump(chats, f, ensure_ascii=False)
+        print(f"Wrote {len(chats)} chats to {args.dump_chats}")
+        return 0
+
+    chats = load_chats_from_file(args.chats_file) if args.chats_file else load_chats_from_db(args.limit_chats)
+    if args.limit_chats:
+        chats = chats[:args.limit_chats]
+    gen = LoadGenerator(chats_to_turns(chats), mode=args.mode, concurrency=args.concurrency, rate=args.rate,
+                        duration=args.duration, max_turns=args.turns, warmup=args.warmup)
+
+    exporter = add_exporter(InMemorySpanExporter())
+    previous = set_inference_backend(make_backend(args))
+    try:
+        # run_inference and the agents print every request; keep the report readable.
+        with open(os.devnull, "w") as devnull, \
+                (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+            gen.run()
+    finally:
+        set_inference_backend(previous)
+        remove_exporter(exporter)
+
+    report = build_report(gen, exporter.get_finished_spans())
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
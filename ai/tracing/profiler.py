@@ -0,0 +1,73 @@
+import os
+import io
+import time
+import random
+import pstats
+import cProfile
+import threading
+import functools
+from typing import Optional, Callable
+
+# --- Configuration ---
+# PROFILE_SAMPLE_RATE: fraction of calls of @sampled_profile functions to run under cProfile (0 disables)
+# PROFILE_DIR: if set, every sampled profile is also dumped there as <name>-<timestamp>.prof
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+
+# Only one cProfile profiler can be active per interpreter, so sampled calls never nest or overlap.
+_active = threading.Lock()
+_stats: Optional[pstats.Stats] = None
+_stats_lock = threading.Lock()
+
+def _record(profiler: cProfile.Profile, name: str) -> None:
+    global _stats
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{time.time_ns()}.prof"))
+    with _stats_lock:
+        if _stats is None:
+            _stats = pstats.Stats(profiler)
+        else:
+            _stats.add(profiler)
+
+def sampled_profile(name: Optional[str] = None, rate: Optional[float] = None) -> Callable:
+    """
+    Decorator that runs a sampled fraction of calls under cProfile and accumulates the
+    results (see profile_report()). With the default rate of 0 the only cost is one
+    comparison per call.
+    """
+    def decorator(func: Callable) -> Callable:
+        profile_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            sample_rate = PROFILE_SAMPLE_RATE if rate is None else rate
+            if sample_rate <= 0 or random.random() >= sample_rate or not _active.acquire(blocking=False):
+                return func(*args, **kwargs)
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    _record(profiler, profile_name)
+            finally:
+                _active.release()
+        return wrapper
+    return decorator
+
+def profile_report(sort_by: str = "cumulative", limit: int = 30) -> str:
+    """Format the accumulated sampled profiles as a pstats table."""
+    with _stats_lock:
+        if _stats is None:
+            return "No profiles sampled."
+        out = io.StringIO()
+        _stats.stream = out
+        _stats.sort_stats(sort_by).print_stats(limit)
+        return out.getvalue()
+
+def reset_profiles() -> None:
+    global _stats
+    with _stats_lock:
+        _stats = None
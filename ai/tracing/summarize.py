@@ -0,0 +1,128 @@
+"""
+Summarize exported traces into a per-stage latency breakdown.
+
+Usage:
+    TRACE_FILE=traces.jsonl python your_script.py
+    python -m ai.tracing.summarize traces.jsonl [--sort total|self|count|p95] [--top N]
+
+For each span name (stage) prints the number of calls, total and self time
+(time not spent in child spans), latency percentiles, the share of the total
+traced time, and summed token counts when spans carry them.
+"""
+import sys
+import json
+import math
+import argparse
+from collections import defaultdict
+from typing import List, Dict, Any, Iterable
+
+TOKEN_ATTRIBUTES = ("llm.input_tokens", "llm.output_tokens")
+
+def load_spans(paths: Iterable[str]) -> List[Dict[str, Any]]:
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    spans.append(json.loads(line))
+    return spans
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of values (q in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _duration_ms(span: Dict[str, Any]) -> float:
+    if span.get("end_time_unix_nano") is None:
+        return 0.0
+    return (span["end_time_unix_nano"] - span["start_time_unix_nano"]) / 1e6
+
+def summarize(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate spans by name. Returns {"stages": [...], "traces": int, "traced_ms": float}."""
+    child_ms: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        if span.get("parent_span_id"):
+            child_ms[span["parent_span_id"]] += _duration_ms(span)
+
+    durations: Dict[str, List[float]] = defaultdict(list)
+    self_ms: Dict[str, float] = defaultdict(float)
+    errors: Dict[str, int] = defaultdict(int)
+    tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    traced_ms = 0.0
+    traces = set()
+
+    for span in spans:
+        name = span["name"]
+        duration = _duration_ms(span)
+        durations[name].append(duration)
+        self_ms[name] += max(0.0, duration - child_ms.get(span["span_id"], 0.0))
+        if span.get("status") == "ERROR":
+            errors[name] += 1
+        for key in TOKEN_ATTRIBUTES:
+            value = span.get("attributes", {}).get(key)
+            if isinstance(value, (int, float)):
+                tokens[name][key] += int(value)
+        if not span.get("parent_span_id"):
+            traced_ms += duration
+            traces.add(span["trace_id"])
+
+    stages = []
+    for name, values in durations.items():
+        stages.append({
+            "name": name,
+            "count": len(values),
+            "errors": errors[name],
+            "total_ms": sum(values),
+            "self_ms": self_ms[name],
+            "self_pct": 100 * self_ms[name] / traced_ms if traced_ms else 0.0,
+            "mean_ms": sum(values) / len(values),
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "max_ms": max(values),
+            "tokens": dict(tokens[name]),
+        })
+    return {"stages": stages, "traces": len(traces), "traced_ms": traced_ms}
+
+def format_summary(summary: Dict[str, Any], sort: str = "total", top: int = 0) -> str:
+    key = {"total": "total_ms", "self": "self_ms", "count": "count", "p95": "p95_ms"}[sort]
+    stages = sorted(summary["stages"], key=lambda s: s[key], reverse=True)
+    if top:
+        stages = stages[:top]
+
+    width = max([len("stage")] + [len(s["name"]) for s in stages])
+    lines = [
+        f"{summary['traces']} trace(s), {summary['traced_ms']:.1f} ms traced in total",
+        "",
+        f"{'stage':<{width}} {'count':>6} {'err':>4} {'total ms':>10} {'self ms':>10} {'self %':>7} "
+        f"{'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}  tokens in/out",
+    ]
+    for s in stages:
+        token_text = ""
+        if s["tokens"]:
+            token_text = f"{s['tokens'].get('llm.input_tokens', 0)}/{s['tokens'].get('llm.output_tokens', 0)}"
+        lines.append(
+            f"{s['name']:<{width}} {s['count']:>6} {s['errors']:>4} {s['total_ms']:>10.1f} {s['self_ms']:>10.1f} "
+            f"{s['self_pct']:>6.1f}% {s['mean_ms']:>9.1f} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['max_ms']:>9.1f}  {token_text}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize span traces into per-stage latency breakdowns.")
+    parser.add_argument("files", nargs="+", help="JSONL trace files written via TRACE_FILE")
+    parser.add_argument("--sort", choices=["total", "self", "count", "p95"], default="total")
+    parser.add_argument("--top", type=int, default=0, help="Only show the N slowest stages")
+    args = parser.parse_args(argv)
+
+    spans = load_spans(args.files)
+    if not spans:
+        print("No spans found.")
+        return 1
+    print(format_summary(summarize(spans), sort=args.sort, top=args.top))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import os
+import json
+import atexit
+import time
+import random
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Callable, Iterator
+
+# Optional: mirror our spans into OpenTelemetry when the SDK is installed and configured.
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# --- Configuration ---
+# TRACE_FILE: append finished spans as JSON lines to this file (read by `python -m ai.tracing.summarize`)
+# TRACE_OTEL: set to "1" to also emit every span through the OpenTelemetry API
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_OTEL = os.getenv("TRACE_OTEL") == "1"
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+class Span:
+    """
+    A timed operation. The fields are modelled on OpenTelemetry spans (ids, parent,
+    nanosecond timestamps, attributes, status, events), but the JSON form is our own,
+    not OTLP. Use TRACE_OTEL=1 to send spans to OpenTelemetry exporters.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "start_time_unix_nano",
+                 "end_time_unix_nano", "attributes", "status", "events", "_otel_span")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else _new_id(128)
+        self.span_id = _new_id(64)
+        self.parent_span_id = parent.span_id if parent else None
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "UNSET"
+        self.events: List[Dict[str, Any]] = []
+        self._otel_span = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+        if self._otel_span is not None:
+            self._otel_span.set_attribute(key, value)
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        self.events.append({"name": name, "time_unix_nano": time.time_ns(), "attributes": attributes or {}})
+        if self._otel_span is not None:
+            self._otel_span.add_event(name, attributes or {})
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status = "ERROR"
+        self.add_event("exception", {"exception.type": type(exc).__name__, "exception.message": str(exc)})
+        if self._otel_span is not None:
+            self._otel_span.record_exception(exc)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_time_unix_nano is None:
+            return None
+        return (self.end_time_unix_nano - self.start_time_unix_nano) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_time_unix_nano,
+            "end_time_unix_nano": self.end_time_unix_nano,
+            "attributes": self.attributes,
+            "status": self.status,
+            "events": self.events,
+        }
+
+    def __repr__(self) -> str:
+        return f"Span({self.name!r}, duration_ms={self.duration_ms})"
+
+# --- Exporters ---
+
+class InMemorySpanExporter:
+    """Keeps finished spans in a list. Meant for tests and for in-process analysis (e.g. load tests)."""
+
+    def __init__(self):
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def get_finished_spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+class JsonlSpanExporter:
+    """
+    Appends finished spans to a file, one JSON object per line. The file stays open
+    and buffered; it is flushed on close(), which runs at interpreter exit.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        atexit.register(self.close)
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+_exporters: List[Any] = []
+
+def add_exporter(exporter: Any) -> Any:
+    """Register an exporter; every finished span is passed to exporter.export(span)."""
+    _exporters.append(exporter)
+    return exporter
+
+def remove_exporter(exporter: Any) -> None:
+    if exporter in _exporters:
+        _exporters.remove(exporter)
+
+if TRACE_FILE:
+    add_exporter(JsonlSpanExporter(TRACE_FILE))
+
+# --- Span API ---
+
+def current_span() -> Optional[Span]:
+    """The innermost active span in this context, or None."""
+    return _current_span.get()
+
+def set_attribute(key: str, value: Any) -> None:
+    """Set an attribute on the current span, if there is one."""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+@contextmanager
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None) -> Iterator[Span]:
+    """
+    Start a span as a child of the current span and make it current.
+    Exceptions are recorded on the span and re-raised.
+    """
+    span = Span(name, _current_span.get(), attributes)
+    otel_cm = None
+    if TRACE_OTEL and otel_trace is not None:
+        otel_cm = otel_trace.get_tracer("ai").start_as_current_span(name, attributes=span.attributes)
+        span._otel_span = otel_cm.__enter__()
+    token = _current_span.set(span)
+    exc_info = (None, None, None)
+    try:
+        yield span
+        if span.status == "UNSET":
+            span.status = "OK"
+    except BaseException as e:
+        exc_info = (type(e), e, e.__traceback__)
+        span.status = "ERROR"
+        span.add_event("exception", {"exception.type": type(e).__name__, "exception.message": str(e)})
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_time_unix_nano = time.time_ns()
+        if otel_cm is not None:
+            # The OTel context manager records the exception and sets the error status itself.
+            otel_cm.__exit__(*exc_info)
+        for exporter in _exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(f"Span exporter error: {e}")
+
+def traced(name: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None) -> Callable:
+    """Decorator that runs the function inside a span (named after the function by default)."""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name, attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,95 @@
+import pytest
+from ai.db import cache, mongodb
+from ai.db.cache import TTLCache, MessageRecord, approx_size
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+def test_get_or_load_reads_through_once():
+    c = TTLCache("t", ttl=60)
+    calls = []
+    load = lambda: calls.append(1) or ["doc"]
+    assert c.get_or_load("k", load) == ["doc"]
+    assert c.get_or_load("k", load) == ["doc"]
+    assert len(calls) == 1
+    assert c.hits == 1 and c.misses == 1
+    assert c.hit_ratio == 0.5
+
+def test_lru_eviction_by_entry_count():
+    c = TTLCache("t", ttl=60, max_entries=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")  # "b" is now least recently used
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.evictions == 1
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache("t", ttl=10)
+    c.set("a", 1)
+    clock[0] += 9
+    assert c.get("a") == 1
+    clock[0] += 2
+    assert c.get("a") is None
+    assert c.expirations == 1
+    assert len(c) == 0
+
+def test_byte_cap_evicts_oldest():
+    value = "x" * 1000
+    size = approx_size(value)
+    c = TTLCache("t", ttl=60, max_entries=100, max_bytes=size * 2)
+    c.set("a", value)
+    c.set("b", value)
+    c.set("c", value)
+    assert c.get("a") is None
+    assert c.get("b") == value and c.get("c") == value
+    assert c.stats()["bytes"] <= size * 2
+
+def test_value_larger_than_byte_cap_is_not_cached():
+    c = TTLCache("t", ttl=60, max_bytes=100)
+    c.set("small", 1)
+    c.set("big", "x" * 1000)
+    assert c.get("big") is None
+    assert c.get("small") == 1
+
+def test_invalidate_and_clear():
+    c = TTLCache("t", ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.invalidate("a")
+    assert c.get("a") is None and c.get("b") == 2
+    c.clear()
+    assert len(c) == 0 and c.stats()["bytes"] == 0
+
+def test_message_record_round_trip():
+    doc = {"_id": 1, "chatId": "c", "role": "user", "content": "hi", "meta": {"x": 1}}
+    record = MessageRecord.from_doc(doc)
+    assert not hasattr(record, "__dict__")
+    assert record.to_dict() == doc
+
+def test_cached_users_are_copied_per_document(monkeypatch):
+    finds = []
+
+    class FakeDB:
+        class users:
+            @staticmethod
+            def find():
+                finds.append(1)
+                return [{"_id": 1, "name": "a", "tags": ["x"]}]
+
+    monkeypatch.setattr(mongodb, "get_db", lambda: FakeDB)
+    mongodb.invalidate_users()
+    try:
+        first = mongodb.get_all_users(use_cache=True)
+        first[0]["name"] = "changed"
+        first.append({"_id": 2})
+        second = mongodb.get_all_users(use_cache=True)
+        assert second == [{"_id": 1, "name": "a", "tags": ["x"]}]
+        assert second[0] is not first[0]
+        assert len(finds) == 1
+    finally:
+        mongodb.invalidate_users()
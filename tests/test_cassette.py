@@ -0,0 +1,73 @@
+import time
+import pytest
+from ai.llm.cassette import Cassette, CassetteBackend, CassetteMiss, request_key
+
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+
+def _record(text, latency=0.0):
+    return {"model": "gpt-4o", "latency": latency, "chunks": [[latency, text]],
+            "input_tokens": 3, "output_tokens": 1, "recorded_at": 0}
+
+def test_put_and_get_survive_reopen(tmp_path):
+    path = str(tmp_path / "a.cassette")
+    cassette = Cassette(path)
+    key = request_key(MESSAGES, "gpt-4o")
+    cassette.put(key, _record("first"))
+    cassette.put(key, _record("second"))
+    assert cassette.get(key)["chunks"][0][1] == "second"
+    cassette.close()
+
+    reopened = Cassette(path, writable=False)
+    assert len(reopened) == 1
+    assert reopened.get(key)["chunks"][0][1] == "second"
+    assert reopened.get(request_key(MESSAGES, "gpt-4.1")) is None
+
+def test_truncated_record_is_dropped_before_appending(tmp_path):
+    path = str(tmp_path / "a.cassette")
+    cassette = Cassette(path)
+    first = request_key(MESSAGES, "gpt-4o")
+    cassette.put(first, _record("ok"))
+    cassette.close()
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 10)  # interrupted write
+
+    cassette = Cassette(path)
+    second = request_key(MESSAGES + [{"role": "user", "content": "More"}], "gpt-4o")
+    cassette.put(second, _record("new"))
+    cassette.close()
+
+    reopened = Cassette(path, writable=False)
+    assert len(reopened) == 2
+    assert reopened.get(second)["chunks"][0][1] == "new"
+
+def test_replay_requires_an_existing_file(tmp_path):
+    path = tmp_path / "typo.cassette"
+    with pytest.raises(FileNotFoundError):
+        CassetteBackend(str(path), mode="replay")
+    assert not path.exists()
+
+def test_replay_serves_recorded_responses(tmp_path):
+    path = str(tmp_path / "a.cassette")
+    cassette = Cassette(path)
+    cassette.put(request_key(MESSAGES, "gpt-4o"), _record("Hello", latency=0.05))
+    cassette.close()
+
+    backend = CassetteBackend(path, mode="replay", latency_scale=0)
+    start = time.monotonic()
+    assert backend(MESSAGES, "gpt-4o") == "Hello"
+    assert time.monotonic() - start < 0.05
+
+    backend.latency_scale = 1.0
+    start = time.monotonic()
+    assert list(backend.stream(MESSAGES, "gpt-4o")) == ["Hello"]
+    assert time.monotonic() - start >= 0.05
+
+    with pytest.raises(CassetteMiss):
+        backend([{"role": "user", "content": "Unrecorded"}], "gpt-4o")
+
+def test_replay_cassette_is_read_only(tmp_path):
+    path = str(tmp_path / "a.cassette")
+    Cassette(path).close()
+    cassette = Cassette(path, writable=False)
+    with pytest.raises(ValueError):
+        cassette.put(request_key(MESSAGES, "gpt-4o"), _record("x"))
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+import pytest
+from ai.llm.inference import set_inference_backend
+from ai.loadgen.backends import FakeBackend
+from ai.loadgen.run import LoadGenerator, TurnResult, build_report, chats_to_turns, format_report
+from ai.tracing.tracer import add_exporter, remove_exporter, InMemorySpanExporter
+
+CHATS = [{"chatId": "c1", "messages": [
+    {"role": "user", "content": "I want new leads from Google Sheets posted to Slack."},
+    {"role": "assistant", "content": "Which sheet?"},
+    {"role": "user", "content": "The Leads sheet."},
+]}]
+
+def _span(name, span_id, trace_id, parent=None, status="OK", duration_ms=10.0, **attributes):
+    return SimpleNamespace(name=name, span_id=span_id, trace_id=trace_id, parent_span_id=parent,
+                           status=status, duration_ms=duration_ms, attributes=attributes)
+
+def _result(trace_id, scheduled, finished, error=None):
+    result = TurnResult(scheduled)
+    result.started, result.finished, result.error, result.trace_id = scheduled, finished, error, trace_id
+    return result
+
+@pytest.fixture
+def fake_backend():
+    exporter = add_exporter(InMemorySpanExporter())
+    previous = set_inference_backend(FakeBackend(base_latency=0, tokens_per_second=1e9, jitter=0, seed=1))
+    yield exporter
+    set_inference_backend(previous)
+    remove_exporter(exporter)
+
+def test_chats_to_turns():
+    turns = chats_to_turns(CHATS)
+    assert [len(t) for t in turns] == [1, 3]
+
+def test_invalid_settings():
+    turns = chats_to_turns(CHATS)
+    with pytest.raises(ValueError):
+        LoadGenerator([])
+    with pytest.raises(ValueError):
+        LoadGenerator(turns, concurrency=0)
+    with pytest.raises(ValueError):
+        LoadGenerator(turns, mode="open", rate=0)
+
+def test_report_skips_warmup_and_counts_retries_and_tokens():
+    gen = LoadGenerator(chats_to_turns(CHATS), warmup=1.0)
+    gen.start_time = 100.0
+    gen.results = [
+        _result("warm", 100.5, 100.6),
+        _result("t1", 101.0, 101.2),
+        _result("t2", 102.0, 102.1, error="RuntimeError: boom"),
+    ]
+    spans = [
+        _span("agent.next_agent", "w1", "warm", **{"agent.attempts": 3}),
+        _span("agent.next_agent", "a1", "t1", duration_ms=50.0, **{"agent.attempts": 2}),
+        _span("agent.inference", "i1", "t1", parent="a1"),
+        _span("llm.run_inference", "l1", "t1", parent="i1", status="ERROR", **{"llm.input_tokens": 10}),
+        _span("agent.inference", "i2", "t1", parent="a1"),
+        _span("llm.run_inference", "l2", "t1", parent="i2", **{"llm.input_tokens": 10, "llm.output_tokens": 4}),
+        _span("llm.run_inference", "orphan", "t1"),
+    ]
+    report = build_report(gen, spans)
+    assert report["turns"] == 2 and report["warmup_turns"] == 1
+    assert report["errors"] == 1 and report["error_samples"] == ["RuntimeError: boom"]
+    assert report["latency_ms"][50] == pytest.approx(200)
+    assert report["client_queued"] is None
+
+    (name, agent), = report["agents"].items()
+    assert name == "agent.next_agent"
+    assert agent["calls"] == 1
+    assert agent["retry_rate"] == 1.0
+    assert agent["inference_error_rate"] == 0.5
+    assert (agent["input_tokens"], agent["output_tokens"]) == (20, 4)
+    assert agent["p50_ms"] == 50.0
+    assert report["retry_rate"] == 1.0
+    assert "agent.next_agent" in format_report(report)
+
+def test_closed_loop_with_fake_backend(fake_backend):
+    gen = LoadGenerator(chats_to_turns(CHATS), mode="closed", concurrency=2, duration=30, max_turns=4)
+    gen.run()
+    report = build_report(gen, fake_backend.get_finished_spans())
+    assert report["turns"] == 4 and report["errors"] == 0
+    for name in ("agent.user_understanding", "agent.next_agent", "agent.workflow_designer"):
+        agent = report["agents"][name]
+        assert agent["calls"] == 4 and agent["retry_rate"] == 0.0
+        assert agent["input_tokens"] > 0 and agent["output_tokens"] > 0
+
+def test_open_loop_reports_client_side_queueing(fake_backend):
+    set_inference_backend(FakeBackend(base_latency=0.02, tokens_per_second=1e9, jitter=0, seed=1))
+    gen = LoadGenerator(chats_to_turns(CHATS), mode="open", concurrency=1, rate=200, duration=0.05)
+    gen.run()
+    report = build_report(gen, fake_backend.get_finished_spans())
+    assert report["turns"] == len(gen.results) > 1
+    assert 0 < report["client_queued"] < report["turns"]
+    assert "queued client-side" in format_report(report)
@@ -0,0 +1,114 @@
+import pytest
+from ai.db import message_stream
+from ai.db.message_stream import MessageStream
+
+def _msg(n, chat_id="c"):
+    return {"_id": n, "chatId": chat_id, "role": "user", "content": f"m{n}"}
+
+def _ids(messages):
+    return [m["_id"] for m in messages]
+
+@pytest.fixture
+def history(monkeypatch):
+    """Stored messages per chat; on_seed(chat_id) runs while get_last_messages is reading."""
+    state = {"messages": [_msg(1), _msg(2)], "on_seed": None, "seeds": 0}
+
+    def get_last_messages(chat_id, n):
+        state["seeds"] += 1
+        docs = [m for m in state["messages"] if m["chatId"] == chat_id][-n:]
+        if state["on_seed"]:
+            on_seed, state["on_seed"] = state["on_seed"], None
+            on_seed(chat_id)
+        return docs
+
+    monkeypatch.setattr(message_stream, "get_last_messages", get_last_messages)
+    return state
+
+def test_message_dispatched_during_seed_appears_once(history):
+    stream = MessageStream()
+    # m2 is in the seed and is also delivered by the stream; m3 only by the stream.
+    history["on_seed"] = lambda chat_id: stream._dispatch([_msg(2), _msg(3)])
+    assert _ids(stream.get_tail("c")) == [1, 2, 3]
+    assert _ids(stream.get_tail("c")) == [1, 2, 3]
+    assert history["seeds"] == 1
+    assert stream._seeding == {}
+
+def test_concurrent_caller_gets_merged_view_without_storing_it(history):
+    stream = MessageStream()
+    seen = []
+
+    def on_seed(chat_id):
+        stream._dispatch([_msg(3)])
+        # A second reader arrives while the first one is still seeding.
+        seen.append(_ids(stream.get_tail(chat_id)))
+        seen.append(chat_id in stream._tails)
+
+    history["on_seed"] = on_seed
+    assert _ids(stream.get_tail("c")) == [1, 2, 3]
+    assert seen == [[1, 2, 3], False]
+    assert history["seeds"] == 2
+
+def test_tail_stays_within_tail_size(history):
+    stream = MessageStream(tail_size=3)
+    history["messages"] = [_msg(n) for n in range(1, 6)]
+    history["on_seed"] = lambda chat_id: stream._dispatch([_msg(6), _msg(7)])
+    assert _ids(stream.get_tail("c")) == [5, 6, 7]
+    stream._dispatch([_msg(8)])
+    assert _ids(stream.get_tail("c")) == [6, 7, 8]
+
+def test_unseeded_chats_are_not_buffered(history):
+    stream = MessageStream()
+    stream._dispatch([_msg(3)])
+    assert stream._tails == {} and stream._seeding == {}
+
+def test_dispatch_filters_chats_and_notifies_handler():
+    received = []
+    stream = MessageStream(lambda chat_id, msgs: received.append((chat_id, _ids(msgs))), chat_ids=["c"])
+    stream._dispatch([_msg(1), _msg(2, chat_id="other"), _msg(3)])
+    assert received == [("c", [1, 3])]
+    assert stream._last_id == 3
+
+class FakeChangeStream:
+    def __init__(self, stream, changes):
+        self.stream = stream
+        self.changes = list(changes)
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if not self.changes:
+            self.stream._stop.set()
+            return None
+        doc = self.changes.pop(0)
+        self.resume_token = {"_data": doc["_id"]}
+        return {"operationType": "insert", "fullDocument": doc}
+
+def test_change_stream_skips_messages_seen_by_catch_up(monkeypatch):
+    received = []
+    stream = MessageStream(lambda chat_id, msgs: received.extend(_ids(msgs)), chat_ids=["c"])
+    stream._last_id = 1
+    calls = []
+
+    def get_messages_after(after_id, chat_id=None, limit=0, chat_ids=None):
+        calls.append((after_id, chat_ids))
+        return [_msg(2), _msg(3)]
+
+    class FakeCollection:
+        def watch(self, pipeline, resume_after=None):
+            return FakeChangeStream(stream, [_msg(2), _msg(3), _msg(4)])
+
+    class FakeDB:
+        messages = FakeCollection()
+
+    monkeypatch.setattr(message_stream, "get_messages_after", get_messages_after)
+    monkeypatch.setattr(message_stream, "get_db", lambda: FakeDB())
+    stream._watch()
+    assert received == [2, 3, 4]
+    assert calls == [(1, ["c"])]
+    assert stream.mode == "change_stream"
+    assert stream._resume_token == {"_data": 4}
@@ -0,0 +1,89 @@
+import pytest
+from ai.llm import messages as llm_messages
+from ai.llm.messages import compile_messages
+
+HISTORY = [
+    {"role": "user", "content": "What is the capital of France?"},
+    {"role": "assistant", "content": "Paris."},
+    {"role": "system", "content": "Answer in one word."},
+    {"role": "user", "content": "And of Italy?"},
+]
+
+BLOCKS = [{"type": "text", "text": "hi"}, {"type": "text", "text": "there"}]
+
+@pytest.fixture(autouse=True)
+def fresh_memo():
+    llm_messages.clear_memo()
+    yield
+    llm_messages.clear_memo()
+
+def test_openai_passes_messages_through_unchanged():
+    msgs = [{"role": "system", "content": "Be brief."}] + HISTORY
+    system, compiled = compile_messages(msgs, "openai")
+    assert system is None
+    assert compiled == msgs
+    # The mid-history system message stays where it was.
+    assert compiled[3] == {"role": "system", "content": "Answer in one word."}
+
+def test_openai_keeps_list_content():
+    msgs = [{"role": "user", "content": BLOCKS}]
+    _, compiled = compile_messages(msgs, "openai")
+    assert compiled[0]["content"] == BLOCKS
+
+def test_anthropic_lifts_system_prompts():
+    system, compiled = compile_messages([{"role": "system", "content": "Be brief."}] + HISTORY, "anthropic")
+    assert system == "Be brief.\n\nAnswer in one word."
+    assert compiled == [
+        {"role": "user", "content": "What is the capital of France?"},
+        {"role": "assistant", "content": "Paris."},
+        {"role": "user", "content": "And of Italy?"},
+    ]
+
+def test_anthropic_keeps_list_content():
+    system, compiled = compile_messages([{"role": "user", "content": BLOCKS}], "anthropic")
+    assert system is None
+    assert compiled == [{"role": "user", "content": BLOCKS}]
+
+def test_anthropic_system_blocks_become_text():
+    system, _ = compile_messages([{"role": "system", "content": BLOCKS}, {"role": "user", "content": "x"}], "anthropic")
+    assert system == "hi\nthere"
+
+def test_google_maps_roles_and_system_instruction():
+    system, compiled = compile_messages([{"role": "system", "content": "Be brief."}] + HISTORY, "google")
+    assert system == "Be brief.\n\nAnswer in one word."
+    assert compiled == [
+        {"role": "user", "parts": ["What is the capital of France?"]},
+        {"role": "model", "parts": ["Paris."]},
+        {"role": "user", "parts": ["And of Italy?"]},
+    ]
+
+def test_google_list_content_becomes_text_parts():
+    _, compiled = compile_messages([{"role": "user", "content": BLOCKS}], "google")
+    assert compiled == [{"role": "user", "parts": ["hi", "there"]}]
+
+def test_unsupported_roles_are_skipped():
+    msgs = [{"role": "user", "content": "a"}, {"role": "tool", "content": "b"}]
+    _, compiled = compile_messages(msgs, "anthropic")
+    assert compiled == [{"role": "user", "content": "a"}]
+
+def test_history_is_compiled_once_across_system_prompts(monkeypatch):
+    calls = []
+    original = llm_messages._COMPILERS["google"]
+    monkeypatch.setitem(llm_messages._COMPILERS, "google", lambda h: calls.append(1) or original(h))
+    first = compile_messages([{"role": "system", "content": "Agent A"}] + HISTORY, "google")
+    second = compile_messages([{"role": "system", "content": "Agent B"}] + HISTORY, "google")
+    assert len(calls) == 1
+    assert first[1] is second[1]
+    assert first[0].startswith("Agent A") and second[0].startswith("Agent B")
+
+def test_unknown_provider():
+    with pytest.raises(ValueError):
+        compile_messages(HISTORY, "mistral")
+
+def test_block_history_is_not_served_from_string_memo():
+    blocks = [{"type": "text", "text": "hi"},
+              {"type": "text", "text": "there", "cache_control": {"type": "ephemeral"}}]
+    _, first = compile_messages([{"role": "user", "content": "hi\nthere"}], "anthropic")
+    _, second = compile_messages([{"role": "user", "content": blocks}], "anthropic")
+    assert first == [{"role": "user", "content": "hi\nthere"}]
+    assert second == [{"role": "user", "content": blocks}]
@@ -0,0 +1,124 @@
+import pytest
+from ai.tracing import profiler
+from ai.tracing.tracer import (start_span, traced, current_span, set_attribute, add_exporter,
+                               remove_exporter, InMemorySpanExporter, JsonlSpanExporter)
+from ai.tracing.summarize import summarize, percentile, load_spans
+
+@pytest.fixture
+def exporter():
+    exporter = add_exporter(InMemorySpanExporter())
+    yield exporter
+    remove_exporter(exporter)
+
+def test_spans_nest_and_record_status(exporter):
+    with start_span("turn") as turn:
+        with start_span("db.query", {"db.collection": "chats"}) as query:
+            assert current_span() is query
+            set_attribute("db.cache_hit", False)
+        assert current_span() is turn
+    assert current_span() is None
+
+    query, turn = exporter.get_finished_spans()
+    assert query.parent_span_id == turn.span_id
+    assert query.trace_id == turn.trace_id
+    assert turn.parent_span_id is None
+    assert query.attributes == {"db.collection": "chats", "db.cache_hit": False}
+    assert query.status == turn.status == "OK"
+    assert query.duration_ms >= 0
+
+def test_exceptions_mark_span_as_error(exporter):
+    with pytest.raises(ValueError):
+        with start_span("llm.run_inference"):
+            raise ValueError("boom")
+    (span,) = exporter.get_finished_spans()
+    assert span.status == "ERROR"
+    assert span.events[0]["attributes"]["exception.type"] == "ValueError"
+
+def test_traced_decorator(exporter):
+    @traced("agent.test", {"agent.kind": "unit"})
+    def agent(x):
+        return x * 2
+
+    assert agent(21) == 42
+    (span,) = exporter.get_finished_spans()
+    assert span.name == "agent.test"
+    assert span.attributes == {"agent.kind": "unit"}
+
+def test_jsonl_exporter_round_trip(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    exporter = add_exporter(JsonlSpanExporter(path))
+    try:
+        with start_span("a"):
+            pass
+    finally:
+        remove_exporter(exporter)
+        exporter.close()
+    (span,) = load_spans([path])
+    assert span["name"] == "a" and span["status"] == "OK"
+
+def _span(name, span_id, start_ms, end_ms, parent=None, trace="t1", **attributes):
+    return {
+        "name": name, "trace_id": trace, "span_id": span_id, "parent_span_id": parent,
+        "start_time_unix_nano": int(start_ms * 1e6), "end_time_unix_nano": int(end_ms * 1e6),
+        "attributes": attributes, "status": "OK",
+    }
+
+def test_summarize_self_time_and_tokens():
+    spans = [
+        _span("agent", "a", 0, 100),
+        _span("llm", "l1", 10, 50, parent="a", **{"llm.input_tokens": 10, "llm.output_tokens": 2}),
+        _span("llm", "l2", 50, 80, parent="a", **{"llm.input_tokens": 5, "llm.output_tokens": 1}),
+    ]
+    summary = summarize(spans)
+    stages = {s["name"]: s for s in summary["stages"]}
+    assert summary["traces"] == 1
+    assert summary["traced_ms"] == pytest.approx(100)
+    assert stages["agent"]["self_ms"] == pytest.approx(30)
+    assert stages["llm"]["self_ms"] == pytest.approx(70)
+    assert stages["llm"]["count"] == 2
+    assert stages["llm"]["tokens"] == {"llm.input_tokens": 15, "llm.output_tokens": 3}
+    assert stages["agent"]["self_pct"] == pytest.approx(30)
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 100) == 100
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 50) == 0.0
+
+def test_sampled_profile_records_when_sampled():
+    profiler.reset_profiles()
+
+    @profiler.sampled_profile("hot", rate=1.0)
+    def hot():
+        return sum(range(1000))
+
+    assert hot() == 499500
+    assert "(hot)" in profiler.profile_report()
+    profiler.reset_profiles()
+
+def test_sampled_profile_disabled_by_default():
+    profiler.reset_profiles()
+
+    @profiler.sampled_profile("cold", rate=0)
+    def cold():
+        return 1
+
+    assert cold() == 1
+    assert profiler.profile_report() == "No profiles sampled."
+
+def test_sampled_profile_does_not_nest():
+    profiler.reset_profiles()
+
+    @profiler.sampled_profile("inner", rate=1.0)
+    def inner():
+        return 1
+
+    @profiler.sampled_profile("outer", rate=1.0)
+    def outer():
+        return inner() + 1
+
+    assert outer() == 2
+    assert profiler.profile_report() != "No profiles sampled."
+    profiler.reset_profiles()
@@ -0,0 +1,178 @@
+import asyncio
+import itertools
+import pytest
+from pymongo import InsertOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+from ai.db import writer
+from ai.db.writer import BufferedWriter, bulk_write, insert_many, save_agent_results
+
+class FakeResult:
+    acknowledged = True
+
+    def __init__(self, inserted_ids=None):
+        self.inserted_ids = inserted_ids
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.write_concern = None
+
+    def with_options(self, write_concern=None):
+        self.write_concern = write_concern
+        return self
+
+    def bulk_write(self, ops, ordered=True):
+        self.db.calls.append((self.name, ordered, self.write_concern))
+        error = self.db.errors.pop(0) if self.db.errors else None
+        if error is not None and not error[1]:
+            raise error[0]
+        # Like an ordered bulk write: stop at the first duplicate _id.
+        for index, op in enumerate(ops):
+            doc = op._doc
+            doc.setdefault("_id", next(self.db.ids))
+            if doc["_id"] in self.db.ids_written:
+                raise BulkWriteError({"writeErrors": [{"index": index, "code": 11000, "errmsg": "E11000"}]})
+            self.db.ids_written.add(doc["_id"])
+            self.db.docs.append((self.name, doc))
+        if error is not None:
+            raise error[0]  # applied, but the reply was lost
+        return FakeResult()
+
+    def insert_many(self, docs, ordered=True):
+        self.db.calls.append((self.name, ordered, self.write_concern))
+        self.db.docs.extend((self.name, doc) for doc in docs)
+        return FakeResult([i for i, _ in enumerate(docs)])
+
+class FakeDB:
+    def __init__(self):
+        self.calls = []
+        self.docs = []
+        self.ids = itertools.count(1)
+        self.ids_written = set()
+        self.errors = []  # (exception, applied_first) for the next bulk_write calls
+
+    def __getitem__(self, name):
+        return FakeCollection(self, name)
+
+    def fail(self, error, applied=False):
+        self.errors.append((error, applied))
+
+    def written(self, collection=None):
+        return [doc["n"] for name, doc in self.docs if collection in (None, name)]
+
+def _msg(chat_id, n):
+    return {"chatId": chat_id, "n": n}
+
+def test_bulk_write_and_insert_many():
+    db = FakeDB()
+    assert bulk_write("messages", [], db=db) is None
+    assert insert_many("messages", [], db=db) == []
+    assert insert_many("messages", [_msg("c", 1), _msg("c", 2)], db=db) == [0, 1]
+    bulk_write("telemetry", [InsertOne(_msg("c", 3))], ordered=False, unacknowledged=True, db=db)
+    assert db.written() == [1, 2, 3]
+    name, ordered, write_concern = db.calls[-1]
+    assert not ordered and write_concern.document == {"w": 0}
+
+def test_save_agent_results_parses_json_output():
+    db = FakeDB()
+    save_agent_results([writer.agent_result_doc("c", "planner", '{"steps": [1]}')], db=db)
+    ((name, doc),) = db.docs
+    assert name == "agent_results"
+    assert doc["result"] == {"steps": [1]} and doc["agent"] == "planner"
+
+def test_flushes_when_batch_is_full():
+    async def run():
+        db = FakeDB()
+        w = BufferedWriter(max_batch_size=3, db=db)
+        await w.add_message(_msg("a", 1))
+        await w.add_message(_msg("a", 2))
+        assert db.docs == []
+        await w.add_message(_msg("b", 3))
+        assert sorted(db.written()) == [1, 2, 3]
+        assert w.flushes == 1 and w.written == 3
+    asyncio.run(run())
+
+def test_failed_chat_keeps_order_across_collections():
+    async def run():
+        db = FakeDB()
+        w = BufferedWriter(db=db)
+        await w.add_message(_msg("a", 1))
+        await w.add("agent_results", _msg("a", 2))
+        db.fail(AutoReconnect("down"))
+        await w.flush()
+        # The agent result must not be written ahead of the failed message.
+        assert db.written() == [] and w.errors == 1
+
+        await w.add_message(_msg("a", 3))
+        await w.flush()
+        assert db.written() == [1, 2, 3]
+        assert [name for name, _, _ in db.calls] == ["messages", "messages", "agent_results", "messages"]
+        assert w.written == 3 and w._count == 0
+    asyncio.run(run())
+
+def test_other_chats_are_written_when_one_fails():
+    async def run():
+        db = FakeDB()
+        w = BufferedWriter(db=db)
+        await w.add_message(_msg("a", 1))
+        await w.add_message(_msg("b", 2))
+        db.fail(AutoReconnect("down"))
+        await w.flush()
+        assert db.written() == [2]
+        await w.flush()
+        assert sorted(db.written()) == [1, 2]
+    asyncio.run(run())
+
+def test_rejected_op_moves_to_failed_and_rest_is_retried():
+    async def run():
+        db = FakeDB()
+        db.ids_written.add("taken")
+        w = BufferedWriter(db=db)
+        await w.add_message(_msg("a", 1))
+        await w.add_message({"_id": "taken", "chatId": "a", "n": 2})
+        await w.add_message(_msg("a", 3))
+        await w.flush()
+        assert db.written() == [1]
+        ((collection, chat_id, op, error),) = w.failed
+        assert (collection, chat_id, op._doc["n"], error["code"]) == ("messages", "a", 2, 11000)
+        await w.flush()
+        assert db.written() == [1, 3]
+        assert w.written == 2 and w._count == 0
+    asyncio.run(run())
+
+def test_retried_inserts_that_were_applied_count_as_written():
+    async def run():
+        db = FakeDB()
+        w = BufferedWriter(db=db)
+        for n in (1, 2, 3):
+            await w.add_message(_msg("a", n))
+        db.fail(AutoReconnect("reply lost"), applied=True)
+        await w.flush()
+        assert db.written() == [1, 2, 3] and w._count == 3
+
+        await w.add_message(_msg("a", 4))
+        await w.flush()
+        assert db.written() == [1, 2, 3, 4]
+        assert w.failed == [] and w._count == 0
+        assert w.written == 4
+    asyncio.run(run())
+
+def test_close_raises_when_writes_remain():
+    async def run():
+        db = FakeDB()
+        w = await BufferedWriter(db=db).start()
+        await w.add_message(_msg("a", 1))
+        db.fail(AutoReconnect("down"))
+        with pytest.raises(RuntimeError):
+            await w.close()
+    asyncio.run(run())
+
+def test_periodic_flush():
+    async def run():
+        db = FakeDB()
+        async with BufferedWriter(flush_interval=0.01, db=db) as w:
+            await w.add_message(_msg("a", 1))
+            await asyncio.sleep(0.05)
+            assert db.written() == [1]
+    asyncio.run(run())